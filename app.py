@@ -1,102 +1,171 @@
 import os
-import json
+import time
+import atexit
 import threading
-from pathlib import Path
-import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
-import os
-import json
-import threading
-from pathlib import Path
-import requests
-from flask import Flask, request, jsonify
-
-# Load environment variables
-try:
-    from dotenv import load_dotenv
-    env_path = Path(__file__).resolve().parent / "env" / ".env"
-    load_dotenv(dotenv_path=str(env_path))
-except Exception:
-    pass
+# Load environment variables before the modules that read them at import
+from config import load_env
+load_env()
+
+from worker_pool import WorkerPool
+from shared_queue import SharedQueue
+from coalescer import Coalescer
+from tps_cache import TPSCache
+from phone_utils import normalize_uk_phone
+from hubspot_writer import HubSpotBatchWriter
+from hubspot_reader import batch_read
+from event_store import EventStore
+from result_store import ResultStore
+from rate_limiter import get_limiter
+from circuit_breaker import get_breaker
+from dead_letter import DeadLetterQueue
+from tps_jobs import TPSAPIError, post_tps_isolating
+import metrics
+import tracing
 
 # Configuration
 HUBSPOT_ACCESS_TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN")
 HUBSPOT_ENDPOINT = os.environ.get("HUBSPOT_ENDPOINT", "https://api.hubapi.com/crm/v3/objects/companies")
 TPS_API_KEY = os.environ.get("TPS_API_KEY")
 TPS_ENDPOINT = os.environ.get("TPS_ENDPOINT", "https://api.tpsservices.co.uk/check")
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.environ.get("WEBHOOK_SHUTDOWN_TIMEOUT", "20"))
+WEBHOOK_SPILL_FILE = os.environ.get("WEBHOOK_SPILL_FILE", "pending_events.jsonl")
+TPS_COALESCE_WINDOW_MS = int(os.environ.get("TPS_COALESCE_WINDOW_MS", "50"))
+TPS_COALESCE_MAX_BATCH = int(os.environ.get("TPS_COALESCE_MAX_BATCH", "500"))
+HUBSPOT_WRITE_FLUSH_MS = int(os.environ.get("HUBSPOT_WRITE_FLUSH_MS", "1000"))
+HUBSPOT_READ_WINDOW_MS = int(os.environ.get("HUBSPOT_READ_WINDOW_MS", "50"))
+WEBHOOK_STATE_PATH = os.environ.get("WEBHOOK_STATE_PATH", "webhook_state.db")
+WEBHOOK_EVENT_TTL_HOURS = float(os.environ.get("WEBHOOK_EVENT_TTL_HOURS", "24"))
+WEBHOOK_EVENT_MAX = int(os.environ.get("WEBHOOK_EVENT_MAX", "100000"))
+WEBHOOK_COALESCE_MS = int(os.environ.get("WEBHOOK_COALESCE_MS", "2000"))
+WEBHOOK_QUEUE_POLL_MS = int(os.environ.get("WEBHOOK_QUEUE_POLL_MS", "100"))
+WEBHOOK_CLAIM_TIMEOUT = float(os.environ.get("WEBHOOK_CLAIM_TIMEOUT", "300"))
+DEAD_LETTER_REPLAY_PER_SEC = float(os.environ.get("DEAD_LETTER_REPLAY_PER_SEC", "5"))
+OBJECT_TYPE = HUBSPOT_ENDPOINT.rstrip("/").rsplit("/", 1)[-1]
+
+# Properties this service writes; change events for them are our own echoes
+OWN_PROPERTIES = ("tps_checked", "tps_status")
 
-# Track processed events
-processed_events = {}
+# Track processed events (shared by all gunicorn workers through SQLite)
+event_store = EventStore(
+    WEBHOOK_STATE_PATH,
+    ttl_seconds=WEBHOOK_EVENT_TTL_HOURS * 3600,
+    max_entries=WEBHOOK_EVENT_MAX,
+)
 
 app = Flask(__name__)
+log = tracing.get_logger("webhook")
+
+# Metrics are summed across gunicorn workers through METRICS_PATH (see metrics.py)
+WEBHOOK_SECONDS = metrics.Histogram("tps_webhook_request_duration_seconds", "Webhook endpoint latency")
+WEBHOOK_EVENTS = metrics.Counter(
+    "tps_webhook_events_total", "Webhook events received, by outcome", labels=("outcome",)
+)
+CHECKS = metrics.Counter(
+    "tps_webhook_checks_total", "Queued company checks, by result", labels=("result",)
+)
+QUEUE_DEPTH = metrics.Gauge("tps_webhook_queue_depth", "Events waiting for a worker", merge="max")
+WRITES_PENDING = metrics.Gauge("tps_hubspot_writes_pending", "HubSpot updates waiting to be batched")
+
+# Values HubSpot is known to hold, so unchanged statuses aren't written again
+# (and numbers TPS refuses, which are quarantined instead of failing everyone's batch)
+result_store = ResultStore.from_env()
+
+def quarantine_number(number, reason):
+    result_store.quarantine_many({number: reason})
+    log.warning("TPS refused number - quarantined", number=number, reason=reason[:100])
+
+def check_tps_batch(numbers):
+    """Check a list of phone numbers with TPS API, results in the same order (None if quarantined)"""
+    return post_tps_isolating(numbers, TPS_ENDPOINT, TPS_API_KEY, quarantine=quarantine_number)
+
+# Checks and writes that fail while TPS or HubSpot is down are kept here and replayed later
+dead_letters = DeadLetterQueue.from_env()
+# Failed attempts of replayed writes, so a write that keeps failing is eventually parked
+_write_attempts = {}
+
+def dead_letter_writes(updates):
+    """Keep HubSpot updates that failed for a transient reason, for replay"""
+    for company_id, properties in updates.items():
+        attempts = _write_attempts.pop(company_id, 0)
+        item = {"objectId": company_id, "_write": properties, "_dead_letter_attempts": attempts}
+        dead_letters.add(item, "hubspot_write")
+    log.warning("HubSpot updates dead-lettered", updates=len(updates))
+
+# Company updates are grouped into HubSpot batch update calls
+hubspot_writer = HubSpotBatchWriter(
+    HUBSPOT_ENDPOINT,
+    HUBSPOT_ACCESS_TOKEN,
+    flush_interval=HUBSPOT_WRITE_FLUSH_MS / 1000.0,
+    store=result_store,
+    object_type=OBJECT_TYPE,
+    on_retryable=dead_letter_writes,
+)
+
+# Shared on-disk cache of recent TPS results (None if TPS_CACHE_PATH is empty)
+tps_cache = TPSCache.from_env()
+
+# Webhook checks from all workers are coalesced into shared TPS batch requests
+tps_coalescer = Coalescer(
+    check_tps_batch,
+    window=TPS_COALESCE_WINDOW_MS / 1000.0,
+    max_batch=TPS_COALESCE_MAX_BATCH,
+    name="tps-coalescer",
+)
 
-def check_tps_for_number(phone_number):
-    """Check a single phone number with TPS API"""
+def check_tps_for_number(phone_number, log=log):
+    """Check a single phone number with TPS API (cached, and batched with concurrent checks)"""
     try:
-        headers = {
-            "Authorization": TPS_API_KEY,
-            "Content-Type": "application/json",
-            "check-tps": "true",
-            "check-ctps": "true"
-        }
-        payload = {"phone_numbers": [phone_number]}
+        if tps_cache:
+            cached = tps_cache.get(phone_number)
+            if cached:
+                log.debug("TPS cache hit", number=phone_number)
+                return cached
         
-        r = requests.post(TPS_ENDPOINT, headers=headers, json=payload, timeout=10)
-        
-        if r.status_code != 200:
-            print(f"  TPS API error ({r.status_code}): {r.text[:200]}")
-            return None
-        
-        results = r.json().get("results", [])
-        if results:
-            return results[0]
-        return None
+        result = tps_coalescer.check(phone_number, timeout=120)
+        if tps_cache and result:
+            tps_cache.put_many({phone_number: result})
+        return result
     except Exception as e:
-        print(f"  TPS check error: {str(e)[:100]}")
+        if isinstance(e, TPSAPIError) and e.fatal:
+            # Every check fails until TPS_API_KEY or the account is fixed; the event is dead-lettered
+            log.error("TPS refused the API key or account", status=e.status_code, error=str(e)[:100])
+        else:
+            log.warning("TPS check failed", number=phone_number, error=str(e)[:100])
         return None
 
-def update_hubspot_company(company_id, tps_result):
-    """Update a HubSpot company with TPS status"""
+def update_hubspot_company(company_id, tps_result, log=log):
+    """Queue a HubSpot company update with TPS status (sent in batches)"""
     try:
         if not tps_result:
-            print(f"  Skipping update for {company_id} - no TPS result")
+            log.debug("no TPS result - skipping update")
             return False
         
         # Determine status
         listed = tps_result.get("on_tps", False) or tps_result.get("on_ctps", False)
         status = "Listed" if listed else "Not Listed"
         
-        url = f"{HUBSPOT_ENDPOINT}/{company_id}"
-        headers = {
-            "Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "properties": {
-                "tps_checked": "true",
-                "tps_status": status
-            }
-        }
-        
-        r = requests.patch(url, headers=headers, json=data, timeout=10)
-        
-        if r.status_code in [200, 204]:
-            print(f"  ✓ Updated company {company_id}: {status}")
-            return True
+        queued = hubspot_writer.update(company_id, {
+            "tps_checked": "true",
+            "tps_status": status
+        })
+        if queued:
+            log.debug("queued update", status=status)
         else:
-            print(f"  ✗ HubSpot update failed ({r.status_code}): {r.text[:200]}")
-            return False
+            log.debug("already up to date in HubSpot", status=status)
+        return queued
     except Exception as e:
-        print(f"  Error updating HubSpot: {str(e)[:100]}")
+        log.error("could not queue HubSpot update", error=str(e)[:100])
         return False
 
-def process_company_event(company_id, properties):
-    """Process a company event and check TPS"""
+def process_company_event(company_id, properties, trace=None):
+    """Process a company event and check TPS; returns the check result for metrics"""
+    trace = trace or tracing.Trace(company_id=company_id)
+    event_log = log.bind(trace=trace.trace_id, company_id=company_id)
     try:
-        print(f"\n🏢 Processing company {company_id}")
-        
         # Extract phone number
         phone_to_check = None
         
@@ -105,106 +174,280 @@ def process_company_event(company_id, properties):
             if isinstance(phone, dict):
                 phone = phone.get("value")
             if phone and isinstance(phone, str) and phone.strip():
-                phone_to_check = phone.strip()
+                phone_to_check = normalize_uk_phone(phone)
+                if not phone_to_check:
+                    event_log.info("skipping invalid UK number", number=phone.strip())
+                    return "invalid_number"
         
         if not phone_to_check:
-            print("  No phone number to check")
-            return
+            event_log.debug("no phone number to check")
+            return "no_phone"
         
         # Check the phone number and update HubSpot
-        print(f"  Checking phone: {phone_to_check}")
-        tps_result = check_tps_for_number(phone_to_check)
-        if tps_result:
-            update_hubspot_company(company_id, tps_result)
-        
-        print(f"✓ Company {company_id} processed successfully")
+        if result_store.quarantined([phone_to_check]):
+            event_log.info("skipping quarantined number", number=phone_to_check)
+            return "quarantined"
+        with trace.span("tps"):
+            tps_result = check_tps_for_number(phone_to_check, log=event_log)
+        if not tps_result:
+            # Refused just now, or failed for a reason worth retrying
+            return "quarantined" if result_store.quarantined([phone_to_check]) else "tps_failed"
+        with trace.span("write"):
+            queued = update_hubspot_company(company_id, tps_result, log=event_log)
+        return "updated" if queued else "unchanged"
+    except Exception:
+        event_log.exception("error processing company")
+        return "error"
+
+def read_company_phones(company_ids):
+    """Batch-read the phone property for many companies, same order as company_ids"""
+    found = batch_read(HUBSPOT_ENDPOINT, HUBSPOT_ACCESS_TOKEN, company_ids, ["phone"])
+    return [found.get(str(company_id), {}).get("phone") for company_id in company_ids]
+
+# Companies that still need a phone lookup are read together, one batch read per burst
+company_reader = Coalescer(
+    read_company_phones,
+    window=HUBSPOT_READ_WINDOW_MS / 1000.0,
+    max_batch=100,
+    name="hubspot-reader",
+)
+
+def event_properties(event):
+    """Collect property values carried in the event itself"""
+    company_properties = {}
+    # HubSpot propertyChange events carry a single propertyName/propertyValue
+    if event.get("propertyName"):
+        company_properties[event["propertyName"]] = {"value": event.get("propertyValue")}
+    # Also accept a list of changes
+    for prop_change in event.get("propertyChanges", []) or []:
+        if isinstance(prop_change, dict):
+            prop_name = prop_change.get("propertyName")
+            prop_value = prop_change.get("propertyValue")
+            company_properties[prop_name] = {"value": prop_value}
+    return company_properties
+
+def own_property_values(event):
+    """Return {property: value} if the event only reports changes to properties we write"""
+    changes = event_properties(event)
+    if changes and all(name in OWN_PROPERTIES for name in changes):
+        return {name: change.get("value") for name, change in changes.items()}
+    return None
+
+# Results that an outage can cause; the event is dead-lettered and checked again later
+RETRY_RESULTS = ("tps_failed", "error")
+
+def process_webhook_event(event):
+    """Process a single queued webhook event (runs on a worker thread)"""
+    if "_write" in event:
+        replay_write(event)
+        return
+    trace = tracing.Trace(event.get("_trace_id"), company_id=event.get("objectId"))
+    trace.add("parse", event.get("_parse_ms") or 0.0)
+    if event.get("_received_at"):
+        trace.add("queue", max(0.0, (time.time() - event["_received_at"]) * 1000))
+    # Later events for the same company may have been folded into this one
+    processed = event_store.take_object(event.get("objectId")) or event
+    result = _process_traced(processed, trace)
+    CHECKS.inc(result=result)
+    if result in RETRY_RESULTS:
+        replay = dead_letters.add(dead_letter_event(processed, event), result)
+        log.warning("event dead-lettered" if replay else "event parked after repeated failures",
+                    trace=trace.trace_id, company_id=event.get("objectId"), result=result,
+                    attempts=event.get("_dead_letter_attempts", 0) + 1)
+    trace.finish(log, result)
+
+def dead_letter_event(processed, queued):
+    """
+    The event to replay after a failure: the one actually processed (the latest
+    folded one), without the property values it carried, so the replay reads
+    the company's current phone rather than trusting a stale payload
+    """
+    item = {k: v for k, v in processed.items() if k not in ("propertyName", "propertyValue", "propertyChanges")}
+    item["_dead_letter_attempts"] = queued.get("_dead_letter_attempts", 0)
+    return item
+
+def replay_write(item):
+    """Queue a dead-lettered HubSpot update again"""
+    company_id = str(item["objectId"])
+    # Bounded in case replayed writes keep succeeding (nothing removes their entries then)
+    if len(_write_attempts) > 10_000:
+        _write_attempts.clear()
+    _write_attempts[company_id] = item.get("_dead_letter_attempts", 0)
+    hubspot_writer.update(company_id, item["_write"])
+
+def _process_traced(event, trace):
+    company_id = event.get("objectId")
+    event_type = event.get("subscriptionType")
+    
+    if not company_id:
+        return "no_object"
+    if event_type and event_type.endswith(".deletion"):
+        return "deleted"
+    
+    # Use the phone from the event payload when it's there
+    company_properties = event_properties(event)
+    if "phone" not in company_properties:
+        try:
+            with trace.span("fetch"):
+                company_properties = {"phone": company_reader.check(str(company_id), timeout=120)}
+        except Exception as e:
+            log.warning("could not fetch company phone", trace=trace.trace_id, company_id=company_id, error=str(e)[:100])
+            return "error"
+    
+    return process_company_event(company_id, company_properties, trace)
+
+# Background workers drain webhook events so the endpoint can ack immediately. The queue
+# lives next to the event store, so any gunicorn worker can pick up any accepted event
+# and pending events survive restarts; old spill files are loaded into it on start.
+worker_pool = WorkerPool(
+    process_webhook_event,
+    workers=WEBHOOK_WORKERS,
+    max_queue=WEBHOOK_QUEUE_SIZE,
+    spill_path=WEBHOOK_SPILL_FILE,
+    name="webhook-worker",
+    shared_queue=SharedQueue(WEBHOOK_STATE_PATH, name="webhook", claim_timeout=WEBHOOK_CLAIM_TIMEOUT),
+    poll_interval=WEBHOOK_QUEUE_POLL_MS / 1000.0,
+)
+
+def start_background_workers():
+    """Start the worker pool and dead-letter replay in this process (idempotent)"""
+    worker_pool.start()
+    dead_letters.start_replay(
+        worker_pool.submit,
+        [get_breaker("tps"), get_breaker("hubspot")],
+        rate_per_sec=DEAD_LETTER_REPLAY_PER_SEC,
+        # Leave half the queue for new webhooks
+        free_slots=lambda: worker_pool.free_slots() // 2,
+    )
+
+@metrics.collector
+def _collect_queue_metrics():
+    QUEUE_DEPTH.set(worker_pool.depth())
+    WRITES_PENDING.set(hubspot_writer.pending())
+
+@atexit.register
+def _shutdown_worker_pool():
+    worker_pool.shutdown(timeout=WEBHOOK_SHUTDOWN_TIMEOUT)
+    updated, failed = hubspot_writer.flush()
+    if updated or failed:
+        log.info("flushed HubSpot updates on shutdown", updated=len(updated), failed=len(failed))
+    try:
+        metrics.flush()
     except Exception as e:
-        print(f"✗ Error processing company: {str(e)[:150]}")
+        log.warning("could not flush metrics on shutdown", error=str(e)[:100])
+    tracing.shutdown()
 
 @app.route('/api/webhooks/hubspot', methods=['POST'])
 def hubspot_webhook():
     """HubSpot Webhook Endpoint - Company Properties"""
-    print("\n" + "="*70)
-    print("✅ WEBHOOK ENDPOINT HIT!")
-    print("="*70)
-    
+    with WEBHOOK_SECONDS.time():
+        return _handle_webhook()
+
+def _handle_webhook():
     try:
-        # Get raw and parsed data
+        started = time.perf_counter()
         raw_data = request.get_data(as_text=True)
-        print(f"Raw payload: {raw_data[:500]}")
+        tracing.sample_payload(log, raw_data)
         
         # Parse events
-        events = request.get_json()
+        events = request.get_json(silent=True)
         if not events:
-            print("No events in payload")
+            log.info("no events in payload")
             return jsonify({"received": True}), 200
         
         # Handle both list and dict
         if isinstance(events, dict):
             events = [events]
+        if not isinstance(events, list):
+            return jsonify({"error": "Expected a JSON object or list of events"}), 400
         
-        print(f"🔔 Received {len(events)} event(s)")
+        events = [e for e in events if isinstance(e, dict) and e.get("objectId")]
+        parse_ms = round((time.perf_counter() - started) * 1000, 1)
         
-        # Process each event
+        start_background_workers()
+        
+        # Refuse the whole delivery if it can't fit, so HubSpot retries it later
+        if len(events) > worker_pool.free_slots():
+            log.warning("queue full - asking HubSpot to retry", events=len(events),
+                        queue_depth=worker_pool.depth(), max_queue=worker_pool.max_queue)
+            WEBHOOK_EVENTS.inc(len(events), outcome="rejected")
+            response = jsonify({"received": False, "error": "queue full", "queue_depth": worker_pool.depth()})
+            return response, 503, {"Retry-After": "30"}
+        
+        queued = 0
+        duplicates = 0
+        coalesced = 0
+        echoes = 0
+        rejected = 0
         for event in events:
+            event_id = event.get("eventId")
             company_id = event.get("objectId")
-            event_type = event.get("subscriptionType")
-            properties = event.get("propertyChanges", [])
-            
-            print(f"Company ID: {company_id}, Type: {event_type}")
             
-            # Build properties dict from change events
-            company_properties = {}
-            for prop_change in properties:
-                if isinstance(prop_change, dict):
-                    prop_name = prop_change.get("propertyName")
-                    prop_value = prop_change.get("propertyValue")
-                    company_properties[prop_name] = {"value": prop_value}
+            # Our own tps_status/tps_checked write coming back - note the value, don't re-check
+            own_values = own_property_values(event)
+            if own_values is not None:
+                result_store.record_synced(OBJECT_TYPE, {company_id: own_values})
+                echoes += 1
+                continue
             
-            # Fetch full company to get phone
-            if company_id:
-                try:
-                    print(f"Fetching full company {company_id}...")
-                    headers = {"Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}"}
-                    url = f"{HUBSPOT_ENDPOINT}/{company_id}?properties=phone"
-                    r = requests.get(url, headers=headers, timeout=10)
-                    if r.status_code == 200:
-                        full_company = r.json()
-                        company_properties = full_company.get("properties", {})
-                        print(f"  ✓ Got company properties")
-                except Exception as e:
-                    print(f"  Could not fetch full company: {str(e)[:50]}")
+            # HubSpot redelivery of an event we already have
+            if not event_store.mark_event(event_id):
+                duplicates += 1
+                continue
             
-            # Extract phone number
-            phone_to_check = None
+            # A check for this company is already pending - it will use this event
+            if not event_store.stage_object(company_id, event):
+                coalesced += 1
+                continue
             
-            if isinstance(company_properties, dict):
-                phone = company_properties.get("phone", {})
-                if isinstance(phone, dict):
-                    phone = phone.get("value")
-                if phone and isinstance(phone, str) and phone.strip():
-                    phone_to_check = phone.strip()
-            
-            # Check TPS for the phone number
-            if company_id and phone_to_check:
-                print(f"  Checking phone: {phone_to_check}")
-                tps_result = check_tps_for_number(phone_to_check)
-                if tps_result:
-                    update_hubspot_company(company_id, tps_result)
+            # Wait out the coalescing window before checking
+            traced = {**event, "_trace_id": tracing.new_trace_id(), "_received_at": time.time(), "_parse_ms": parse_ms}
+            if worker_pool.submit(traced, delay=WEBHOOK_COALESCE_MS / 1000.0):
+                queued += 1
+            else:
+                # Forget it so HubSpot's retry isn't treated as a duplicate
+                event_store.unmark_event(event_id)
+                event_store.unstage_object(company_id)
+                rejected += 1
+        
+        summary = {"queued": queued, "duplicates": duplicates, "coalesced": coalesced, "echoes": echoes}
+        for outcome, count in (*summary.items(), ("rejected", rejected)):
+            if count:
+                WEBHOOK_EVENTS.inc(count, outcome=outcome)
+        if rejected:
+            log.warning("could not queue events", rejected=rejected, events=len(events))
+            response = jsonify({"received": False, "error": "queue full", **summary})
+            return response, 503, {"Retry-After": "30"}
         
-        print("✓ Webhook processed successfully")
-        return jsonify({"received": True}), 200
+        log.info("webhook received", events=len(events), **summary)
+        return jsonify({"received": True, **summary}), 200
     
     except Exception as e:
-        print(f"✗ Webhook error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("webhook error")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics, summed across all gunicorn workers"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "ok", "processed_events": len(processed_events)}), 200
+    return jsonify({
+        "status": "ok",
+        "processed_events": len(event_store),
+        "events": event_store.stats(),
+        "workers": worker_pool.stats(),
+        "tps_coalescer": tps_coalescer.stats(),
+        "tps_cache": tps_cache.stats() if tps_cache else None,
+        "hubspot_reader": company_reader.stats(),
+        "hubspot_writer": hubspot_writer.stats(),
+        "rate_limits": {name: get_limiter(name).stats() for name in ("hubspot", "tps")},
+        "circuits": {name: get_breaker(name).stats() for name in ("hubspot", "tps")},
+        "dead_letters": dead_letters.stats(),
+        "log_records_dropped": tracing.dropped(),
+    }), 200
 
 if __name__ == "__main__":
     app.run()
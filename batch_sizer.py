@@ -0,0 +1,165 @@
+"""
+Adaptive sizing of TPS check requests.
+
+A fixed TPS_SUB_BATCH_SIZE is either too large (requests time out or are
+refused with 413) or too small (round trips wasted on per-request overhead).
+AdaptiveBatchSizer starts at the configured size and after every request
+moves it towards the size expected to answer in the target latency:
+
+- success: scale by target / observed latency (smoothed), at most halving or
+  growing by half per step, which settles where latency meets the target;
+- a request that timed out or was refused as too large (413): halve at once;
+- other errors (5xx) only shrink the size while they are frequent, since an
+  outage isn't caused by the batch size (the circuit breaker handles those);
+- never above the size whose request body would exceed max_payload_bytes.
+
+Every decision is appended to a JSON-lines log (TPS_BATCH_LOG) with the
+measurements behind it, so the limits and target can be tuned afterwards:
+
+    {"ts": ..., "items": 1000, "seconds": 1.21, "bytes": 17012, "error": null,
+     "size": 1000, "next": 1240, "reason": "latency"}
+"""
+
+import json
+import os
+import threading
+import time
+
+import metrics
+
+DEFAULT_TARGET_SECONDS = 2.0
+DEFAULT_MIN_SIZE = 50
+DEFAULT_MAX_SIZE = 5000
+DEFAULT_MAX_PAYLOAD_BYTES = 1_000_000
+# Weight of the newest latency observation in the moving average
+SMOOTHING = 0.3
+# Share of recent requests failing before errors shrink the size
+ERROR_RATE_LIMIT = 0.2
+_ERROR_WINDOW = 20
+
+BATCH_SIZE = metrics.Gauge("tps_request_batch_size", "Numbers per TPS request chosen by the adaptive sizer")
+DECISIONS = metrics.Counter("tps_batch_size_decisions_total", "Adaptive TPS batch size changes", labels=("reason",))
+
+
+class AdaptiveBatchSizer:
+    """Chooses the next request size from the latency, payload and errors of earlier requests"""
+
+    def __init__(self, initial, minimum=DEFAULT_MIN_SIZE, maximum=DEFAULT_MAX_SIZE,
+                 target_seconds=DEFAULT_TARGET_SECONDS, max_payload_bytes=DEFAULT_MAX_PAYLOAD_BYTES,
+                 log_path=None, name="tps"):
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.target_seconds = max(0.01, float(target_seconds))
+        self.max_payload_bytes = int(max_payload_bytes) if max_payload_bytes else None
+        self.log_path = str(log_path) if log_path else None
+        self.name = name
+        self._size = self._clamp(initial)
+        self._seconds_per_item = None
+        self._bytes_per_item = None
+        self._recent_errors = []
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        BATCH_SIZE.set(self._size)
+
+    @classmethod
+    def from_env(cls, initial):
+        """Build a sizer starting at initial from TPS_BATCH_* settings (None if TPS_ADAPTIVE_BATCH=0)"""
+        if os.environ.get("TPS_ADAPTIVE_BATCH", "1").strip().lower() in ("0", "false", "no"):
+            return None
+
+        def number(name, default):
+            try:
+                return float(os.environ.get(name, str(default)))
+            except ValueError:
+                return default
+
+        return cls(
+            initial,
+            minimum=number("TPS_BATCH_MIN", DEFAULT_MIN_SIZE),
+            maximum=number("TPS_BATCH_MAX", DEFAULT_MAX_SIZE),
+            target_seconds=number("TPS_TARGET_LATENCY_MS", DEFAULT_TARGET_SECONDS * 1000) / 1000.0,
+            max_payload_bytes=number("TPS_MAX_PAYLOAD_BYTES", DEFAULT_MAX_PAYLOAD_BYTES),
+            log_path=os.environ.get("TPS_BATCH_LOG", "tps_batch_sizing.jsonl"),
+        )
+
+    def _clamp(self, size):
+        return max(self.minimum, min(self.maximum, int(size)))
+
+    def size(self):
+        """Size for the next request"""
+        return self._size
+
+    def record(self, items, seconds, payload_bytes=None, error=None):
+        """
+        Feed back one request: its size, latency and body size, and error -
+        None, "timeout", "too_large" or any other string for other failures.
+        Returns the size for the next request.
+        """
+        with self._lock:
+            self.requests += 1
+            size = self._size
+            self._recent_errors = (self._recent_errors + [error is not None])[-_ERROR_WINDOW:]
+            if payload_bytes and items:
+                per_item = payload_bytes / items
+                self._bytes_per_item = per_item if self._bytes_per_item is None else (
+                    SMOOTHING * per_item + (1 - SMOOTHING) * self._bytes_per_item)
+
+            if error in ("timeout", "too_large"):
+                self.errors += 1
+                reason = error
+                # Only shrink below the size that failed, however many were in flight
+                new = min(size, items) // 2
+            elif error is not None:
+                self.errors += 1
+                error_rate = sum(self._recent_errors) / len(self._recent_errors)
+                if len(self._recent_errors) >= 5 and error_rate > ERROR_RATE_LIMIT:
+                    reason, new = "error_rate", size * 3 // 4
+                else:
+                    reason, new = "error_ignored", size
+            elif items < size * 0.5:
+                # A short tail chunk (or one sent before a big change) says little about the current size
+                reason, new = "short_request", size
+            else:
+                per_item = seconds / items
+                self._seconds_per_item = per_item if self._seconds_per_item is None else (
+                    SMOOTHING * per_item + (1 - SMOOTHING) * self._seconds_per_item)
+                # Scaling by target / latency converges on the size that meets the target,
+                # since the fixed per-request overhead shrinks as a share of larger requests
+                ratio = self.target_seconds / max(self._seconds_per_item * items, 1e-6)
+                reason, new = "latency", int(items * max(0.5, min(1.5, ratio)))
+
+            if self.max_payload_bytes and self._bytes_per_item:
+                cap = int(self.max_payload_bytes / self._bytes_per_item)
+                if new > cap:
+                    new, reason = cap, "payload"
+            new = self._clamp(new)
+            self._size = new
+
+        if new != size:
+            DECISIONS.inc(reason=reason)
+            BATCH_SIZE.set(new)
+        self._log({
+            "ts": round(time.time(), 3), "items": items, "seconds": round(seconds, 4),
+            "bytes": payload_bytes, "error": error, "size": size, "next": new, "reason": reason,
+        })
+        return new
+
+    def _log(self, entry):
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"⚠ Could not record batch size decision: {str(e)[:100]}")
+            self.log_path = None
+
+    def stats(self):
+        return {
+            "size": self._size,
+            "requests": self.requests,
+            "errors": self.errors,
+            "seconds_per_item": self._seconds_per_item,
+            "bytes_per_item": self._bytes_per_item,
+        }
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+"""
+Offline benchmarks against the local API stand-ins in mock_apis.py.
+
+    python benchmark.py webhook --bursts 200 --burst-size 50
+    python benchmark.py webhook --events recorded_bursts.jsonl
+    python benchmark.py batch --records 100000
+    python benchmark.py backfill --records 1000000 --tps-latency-ms 150
+    python benchmark.py sync --records 100000 --hubspot-latency-ms 100
+
+webhook posts event bursts to app.hubspot_webhook in this process (synthetic
+bursts, or one recorded delivery - a JSON list of events - per line of
+--events) and waits until the workers have handled every queued event. batch
+runs `tps_cli.py check` over the synthetic contacts (up to --records) and
+backfill runs `tps_cli.py backfill` over the synthetic companies, each as a
+child process - or, with --shards N, as N concurrent `--shard i/N` processes
+followed by `tps_cli.py merge`, timed together. sync first checks the
+synthetic contacts (untimed, with its API calls left out of the report), then
+times `tps_cli.py sync` writing the stored statuses back through the
+diff-aware batch writer.
+
+Every run gets a fresh temporary directory for its state files (stores,
+caches, checkpoints, metrics), and the client-side rate limits are raised so
+the code under test sets the pace; pass --env HUBSPOT_RATE_PER_SEC=10 (etc.)
+to benchmark with production settings. The report covers throughput, p50/p99
+latency, peak memory and API calls per record; --json writes it to a file so
+runs can be compared.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+import mock_apis
+
+HERE = Path(__file__).resolve().parent
+JOBS = {
+    "batch": ["check", "--object-type", "contacts"],
+    "backfill": ["backfill", "--object-type", "companies"],
+    "sync": ["sync", "--object-type", "contacts"],
+}
+# Client-side limits are raised unless given with --env
+FAST_LIMITS = {
+    "HUBSPOT_RATE_PER_SEC": "1000",
+    "HUBSPOT_SEARCH_RATE_PER_SEC": "1000",
+    "TPS_RATE_PER_SEC": "1000",
+}
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def histogram_quantile(buckets, q):
+    """Estimate a quantile from cumulative {upper bound: count} histogram buckets"""
+    bounds = sorted(buckets.items())
+    if not bounds or not bounds[-1][1]:
+        return None
+    rank = q * bounds[-1][1]
+    lower, below = 0.0, 0
+    for bound, count in bounds:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower
+            return lower + (bound - lower) * ((rank - below) / max(1, count - below))
+        lower, below = bound, count
+    return lower
+
+
+def api_latency(metrics_path):
+    """p50/p99 seconds per upstream from the http_client latency histogram"""
+    import metrics
+
+    os.environ["METRICS_PATH"] = str(metrics_path)
+    buckets = {}
+    for (sample, labels), value in metrics.totals().items():
+        if sample != "tps_http_request_duration_seconds_bucket":
+            continue
+        parsed = json.loads(labels)
+        series = buckets.setdefault(parsed.get("upstream", ""), {})
+        le = float("inf") if parsed["le"] == "+Inf" else float(parsed["le"])
+        series[le] = series.get(le, 0) + value
+    return {
+        upstream: {"p50": histogram_quantile(series, 0.5), "p99": histogram_quantile(series, 0.99)}
+        for upstream, series in sorted(buckets.items())
+    }
+
+
+def state_env(workdir):
+    return {
+        "RESULT_STORE_PATH": str(workdir / "tps_results.db"),
+        "TPS_CACHE_PATH": str(workdir / "tps_cache.db"),
+        "RATE_LIMIT_STATE_PATH": str(workdir / "rate_limits.db"),
+        "CHECKPOINT_PATH": str(workdir / "checkpoint.json"),
+        "SYNC_STATE_PATH": str(workdir / "sync_state.json"),
+        "METRICS_PATH": str(workdir / "metrics.db"),
+        "WEBHOOK_STATE_PATH": str(workdir / "webhook_state.db"),
+        "WEBHOOK_SPILL_FILE": str(workdir / "pending_events.jsonl"),
+        "CIRCUIT_STATE_PATH": str(workdir / "circuits.db"),
+        "DEAD_LETTER_PATH": str(workdir / "dead_letters.db"),
+        "TPS_BATCH_LOG": str(workdir / "tps_batch_sizing.jsonl"),
+        "HUBSPOT_ACCESS_TOKEN": "benchmark",
+        "TPS_API_KEY": "benchmark",
+    }
+
+
+def start_mock(args, workdir):
+    """Run the stand-ins in a child process so their memory and CPU aren't counted"""
+    argv = [sys.executable, str(HERE / "mock_apis.py"), "--port", "0", "--records", str(args.records)]
+    if args.unique_numbers:
+        argv += ["--unique-numbers", str(args.unique_numbers)]
+    for name in ("hubspot", "tps"):
+        for option in ("latency_ms", "jitter_ms", "error_rate", "rate_limit"):
+            argv += [f"--{name}-{option.replace('_', '-')}", str(getattr(args, f"{name}_{option}"))]
+    argv += ["--tps-item-latency-ms", str(args.tps_item_latency_ms), "--tps-max-batch", str(args.tps_max_batch),
+             "--tps-reject-rate", str(args.tps_reject_rate)]
+    if args.tps_auth_fail_after is not None:
+        argv += ["--tps-auth-fail-after", str(args.tps_auth_fail_after)]
+    log = open(workdir / "mock_apis.log", "w")
+    process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=log, text=True)
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError(f"mock_apis.py did not start (see {workdir / 'mock_apis.log'})")
+    return process, base_url
+
+
+def mock_stats(base_url):
+    return requests.get(f"{base_url}/_stats", timeout=10).json()
+
+
+def api_calls(stats, records):
+    calls = {}
+    for upstream in ("hubspot", "tps"):
+        for operation, count in stats[upstream]["calls"].items():
+            calls[f"{upstream}.{operation}"] = count
+    total = sum(calls.values())
+    return {
+        "total": total,
+        "per_record": round(total / records, 4) if records else None,
+        "by_operation": calls,
+        "injected_errors": stats["hubspot"]["errors"] + stats["tps"]["errors"],
+        "throttled": stats["hubspot"]["throttled"] + stats["tps"]["throttled"],
+    }
+
+
+# --- scenarios ---
+def start_cli(argv, log_path, workdir, env):
+    with open(log_path, "w") as log:
+        return subprocess.Popen(
+            [sys.executable, str(HERE / "tps_cli.py"), *argv], cwd=workdir, env=env,
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, text=True,
+        )
+
+
+def wait_cli(argv, log_path, process):
+    """None if the job succeeded, else its exit status and the end of its log"""
+    returncode = process.wait()
+    if returncode != 0:
+        tail = Path(log_path).read_text(errors="replace").splitlines()[-15:]
+        return f"tps_cli.py {' '.join(argv)} exited with {returncode}:\n" + "\n".join(tail)
+    return None
+
+
+def run_job(args, workdir, base_url, env):
+    argv = list(JOBS[args.scenario])
+    env.update(
+        HUBSPOT_ENDPOINT=f"{base_url}/crm/v3/objects/{argv[2]}",
+        TPS_ENDPOINT=f"{base_url}/check",
+    )
+    if args.scenario in ("batch", "sync"):
+        argv += ["--limit", str(args.records)]
+    if args.scenario == "batch" and args.delta:
+        argv.append("--delta")
+    if args.partitions and args.scenario != "sync":
+        argv += ["--partitions", str(args.partitions)]
+    if args.scenario == "sync":
+        # Results to write back, from a check whose metrics and API calls aren't part of the report
+        setup_argv, setup_log = ["check", "--object-type", argv[2], "--limit", str(args.records)], workdir / "setup.log"
+        setup_env = {**env, "METRICS_PATH": str(workdir / "setup_metrics.db"), "TPS_BATCH_LOG": ""}
+        error = wait_cli(setup_argv, setup_log, start_cli(setup_argv, setup_log, workdir, setup_env))
+        if error:
+            raise RuntimeError(f"Could not prepare results to sync: {error}")
+        requests.post(f"{base_url}/_reset", timeout=10).raise_for_status()
+    runs = [(argv, workdir / f"{args.scenario}.log")]
+    if args.shards > 1:
+        runs = [(argv + ["--shard", f"{i}/{args.shards}"], workdir / f"{args.scenario}.shard-{i}.log")
+                for i in range(1, args.shards + 1)]
+    log_path = runs[0][1]
+    started = time.perf_counter()
+    processes = [(run_argv, run_log, start_cli(run_argv, run_log, workdir, env)) for run_argv, run_log in runs]
+    # A failed job (e.g. under --tps-auth-fail-after) is reported with the run's stats rather than raised
+    failures = [error for error in (wait_cli(*process) for process in processes) if error]
+    if args.shards > 1 and args.scenario != "sync" and not failures:
+        merge_argv, merge_log = ["merge", "--object-type", argv[2]], workdir / "merge.log"
+        failures += filter(None, [wait_cli(merge_argv, merge_log, start_cli(merge_argv, merge_log, workdir, env))])
+    elapsed = time.perf_counter() - started
+    return {
+        "records": args.records,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round(args.records / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "log": str(log_path),
+        "failures": failures,
+        "writes": sync_writes([run_log for _, run_log in runs]) if args.scenario == "sync" else None,
+    }
+
+
+def sync_writes(log_paths):
+    """{"updated", "unchanged", "failed"} summed from the sync runs' summaries, to show what the diff-aware writer skipped"""
+    found = {"updated": 0, "unchanged": 0, "failed": 0}
+    for log_path in log_paths:
+        text = Path(log_path).read_text(errors="replace")
+        for key, label in (("updated", "Successfully updated"), ("unchanged", "Already up to date"), ("failed", "Failed")):
+            match = re.search(rf"{label}: (\d+)", text)
+            found[key] += int(match.group(1)) if match else 0
+    return found
+
+
+def batch_sizing(path):
+    """Summarise the adaptive TPS sizer's decision log, if the run wrote one"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            decisions = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return None
+    if not decisions:
+        return None
+    return {
+        "first": decisions[0]["size"],
+        "final": decisions[-1]["next"],
+        "requests": len(decisions),
+        "changes": sum(1 for d in decisions if d["next"] != d["size"]),
+        "errors": sum(1 for d in decisions if d["error"]),
+    }
+
+
+def quarantined(path):
+    """Numbers the run quarantined in its result store (None if it has no quarantine table)"""
+    if not Path(path).exists():
+        return None
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM tps_quarantine").fetchone()[0]
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def load_bursts(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                events = json.loads(line)
+                yield events if isinstance(events, list) else [events]
+
+
+def run_webhook(args, workdir, base_url, env):
+    env.update(
+        HUBSPOT_ENDPOINT=f"{base_url}/crm/v3/objects/companies",
+        TPS_ENDPOINT=f"{base_url}/check",
+    )
+    env.setdefault("WEBHOOK_COALESCE_MS", str(args.coalesce_ms))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.update(env)
+    os.chdir(workdir)
+    sys.path.insert(0, str(HERE))
+    import app
+
+    # Time each event from acceptance to the end of its handling
+    done = []
+    done_lock = threading.Lock()
+    handler = app.worker_pool.handler
+
+    def timed(event):
+        try:
+            handler(event)
+        finally:
+            latency = time.time() - event.get("_received_at", time.time())
+            with done_lock:
+                done.append(latency)
+
+    app.worker_pool.handler = timed
+
+    if args.events:
+        bursts = list(load_bursts(args.events))
+    else:
+        portal = mock_apis.Portal(args.records, args.unique_numbers)
+        bursts = list(mock_apis.webhook_bursts(portal, args.bursts, args.burst_size))
+    pending = list(enumerate(bursts))
+    pending_lock = threading.Lock()
+    acks, outcomes = [], {"queued": 0, "duplicates": 0, "coalesced": 0, "echoes": 0, "rejected": 0}
+
+    def client():
+        test_client = app.app.test_client()
+        while True:
+            with pending_lock:
+                if not pending:
+                    return
+                _, burst = pending.pop(0)
+            started = time.perf_counter()
+            response = test_client.post("/api/webhooks/hubspot", json=burst)
+            elapsed = time.perf_counter() - started
+            body = response.get_json(silent=True) or {}
+            with pending_lock:
+                acks.append(elapsed)
+                if response.status_code == 503 and "queued" not in body:
+                    outcomes["rejected"] += len(burst)
+                for key in ("queued", "duplicates", "coalesced", "echoes"):
+                    outcomes[key] += int(body.get(key) or 0)
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client, daemon=True) for _ in range(max(1, args.clients))]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    deadline = time.monotonic() + args.timeout
+    while len(done) < outcomes["queued"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    app.hubspot_writer.flush()
+
+    events = sum(len(b) for b in bursts)
+    return {
+        "records": events,
+        "events": events,
+        "deliveries": len(bursts),
+        "outcomes": outcomes,
+        "handled": len(done),
+        "seconds": round(elapsed, 3),
+        "events_per_sec": round(len(done) / elapsed, 1) if elapsed else None,
+        "event_latency": {"p50": _percentile(done, 0.5), "p99": _percentile(done, 0.99)},
+        "ack_latency": {"p50": _percentile(acks, 0.5), "p99": _percentile(acks, 0.99)},
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _ms(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def print_report(report):
+    print()
+    print("=" * 70)
+    size = f"{report['events']} events" if "events" in report else f"{report['records']} records"
+    print(f"BENCHMARK: {report['scenario']} ({size})")
+    print("=" * 70)
+    print(f"Wall time:            {report['seconds']}s")
+    if "events_per_sec" in report:
+        o = report["outcomes"]
+        print(f"Events/sec:           {report['events_per_sec']} ({report['handled']} handled of {report['events']})")
+        print(f"Outcomes:             {o['queued']} queued, {o['coalesced']} coalesced, "
+              f"{o['duplicates']} duplicate, {o['echoes']} echoes, {o['rejected']} rejected")
+        print(f"Event latency:        p50 {_ms(report['event_latency']['p50'])}  p99 {_ms(report['event_latency']['p99'])}")
+        print(f"Webhook ack:          p50 {_ms(report['ack_latency']['p50'])}  p99 {_ms(report['ack_latency']['p99'])}")
+    else:
+        print(f"Records/sec:          {report['records_per_sec']}")
+        writes = report.get("writes")
+        if writes:
+            print(f"Writes:               {writes['updated']} updated, {writes['unchanged']} already up to date, "
+                  f"{writes['failed']} failed")
+    for upstream, latency in report["api_latency"].items():
+        print(f"{upstream + ' calls:':<22}p50 {_ms(latency['p50'])}  p99 {_ms(latency['p99'])}")
+    sizing = report.get("tps_batch_sizing")
+    if sizing:
+        print(f"TPS request size:     {sizing['first']} -> {sizing['final']} "
+              f"({sizing['changes']} changes over {sizing['requests']} requests, {sizing['errors']} errors)")
+    if report.get("quarantined"):
+        print(f"Quarantined numbers:  {report['quarantined']}")
+    print(f"Peak memory:          {report['peak_rss_mb']} MB")
+    calls = report["api_calls"]
+    print(f"API calls:            {calls['total']} ({calls['per_record']} per record)")
+    for operation, count in sorted(calls["by_operation"].items()):
+        print(f"  {operation:<22}{count}")
+    if calls["injected_errors"] or calls["throttled"]:
+        print(f"  injected errors: {calls['injected_errors']}, throttled (429): {calls['throttled']}")
+    for failure in report.get("failures") or []:
+        print(f"✗ {failure}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark against local TPS and HubSpot stand-ins")
+    parser.add_argument("scenario", choices=("webhook", "batch", "backfill", "sync"))
+    mock_apis.add_arguments(parser)
+    parser.add_argument("--events", help="JSON-lines file of recorded webhook deliveries (webhook)")
+    parser.add_argument("--bursts", type=int, default=100, help="synthetic webhook deliveries (webhook)")
+    parser.add_argument("--burst-size", type=int, default=20, help="events per synthetic delivery (webhook)")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent webhook senders (webhook)")
+    parser.add_argument("--coalesce-ms", type=int, default=0, help="WEBHOOK_COALESCE_MS for the run (webhook)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for queued events (webhook)")
+    parser.add_argument("--delta", action="store_true", help="check with --delta (batch)")
+    parser.add_argument("--partitions", type=int, default=0, help="FETCH_PARTITIONS (batch/backfill)")
+    parser.add_argument("--shards", type=int, default=1, help="concurrent --shard processes, then merge (batch/backfill; sync without merge)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra environment settings")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the run's temporary directory")
+    args = parser.parse_args(argv)
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"tps-bench-{args.scenario}-"))
+    env = dict(os.environ)
+    env.update(FAST_LIMITS)
+    env.update(state_env(workdir))
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+
+    process, base_url = start_mock(args, workdir)
+    try:
+        if args.scenario == "webhook":
+            report = run_webhook(args, workdir, base_url, env)
+        else:
+            report = run_job(args, workdir, base_url, env)
+        report["scenario"] = args.scenario
+        report["api_calls"] = api_calls(mock_stats(base_url), report["records"])
+        report["api_latency"] = api_latency(workdir / "metrics.db")
+        report["tps_batch_sizing"] = batch_sizing(workdir / "tps_batch_sizing.jsonl")
+        report["quarantined"] = quarantined(workdir / "tps_results.db")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.json}")
+    if args.keep:
+        print(f"ℹ Run files kept in {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if report.get("failures") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Circuit breakers for the TPS and HubSpot upstreams.
+
+Each upstream has one breaker, and like the rate limiter its state lives in
+the state backend by default, so every thread and process on the machine
+trips and recovers together. After CIRCUIT_FAILURE_THRESHOLD consecutive
+failed attempts (connection errors, timeouts or 5xx responses) the breaker
+opens and requests fail immediately with CircuitOpenError instead of waiting
+out timeouts and retries. Once CIRCUIT_RESET_SECONDS have passed, a single
+probe request is let through (half-open): success closes the breaker,
+failure opens it for another interval. 429s are the rate limiter's business
+and don't count as failures.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+import metrics
+import state_backend
+import tracing
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30.0
+
+TRANSITIONS = metrics.Counter(
+    "tps_circuit_transitions_total", "Circuit breaker state changes", labels=("upstream", "state"),
+)
+REJECTED = metrics.Counter(
+    "tps_circuit_rejected_total", "Requests failed fast by an open circuit breaker", labels=("upstream",),
+)
+log = tracing.get_logger("circuit")
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request while the upstream's breaker is open"""
+
+    def __init__(self, upstream, retry_in=None):
+        self.upstream = upstream
+        self.retry_in = retry_in
+        wait = f", next probe in {retry_in:.0f}s" if retry_in else ""
+        super().__init__(f"{upstream} circuit open{wait}")
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker whose state can be shared across processes"""
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS,
+                 path=None):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = max(0.1, float(reset_seconds))
+        self.path = str(path) if path else None
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # In-process state (used when there is no state file): state, failures, changed_at
+        self._row = (CLOSED, 0, 0.0)
+        self._last = self._row
+        if self.path:
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS circuits ("
+                " name TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " failures INTEGER NOT NULL,"
+                " changed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO circuits (name, state, failures, changed_at) VALUES (?, ?, 0, ?)",
+                (self.name, CLOSED, time.time()),
+            )
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=True)
+
+    def _read(self):
+        if not self.path:
+            with self._lock:
+                row = self._row
+        else:
+            row = self._conn().execute(
+                "SELECT state, failures, changed_at FROM circuits WHERE name = ?", (self.name,)
+            ).fetchone()
+        self._last = row
+        return row
+
+    def _update(self, fn):
+        """Apply fn(state, failures, changed_at, now) -> ((state, failures, changed_at), result) atomically"""
+        if not self.path:
+            with self._lock:
+                row, result = fn(*self._row, time.time())
+                before, self._row = self._row, row
+        else:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = conn.execute(
+                    "SELECT state, failures, changed_at FROM circuits WHERE name = ?", (self.name,)
+                ).fetchone()
+                row, result = fn(*before, time.time())
+                if row != before:
+                    conn.execute(
+                        "UPDATE circuits SET state = ?, failures = ?, changed_at = ? WHERE name = ?",
+                        (*row, self.name),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._last = row
+        if row[0] != before[0]:
+            TRANSITIONS.inc(upstream=self.name, state=row[0])
+            if row[0] == OPEN:
+                log.warning("circuit open", upstream=self.name, failures=row[1], reset_s=self.reset_seconds)
+            else:
+                log.info(f"circuit {row[0].replace('_', '-')}", upstream=self.name)
+        return result
+
+    # --- callers ---
+    def allow(self):
+        """True if a request may be sent now (possibly as the half-open probe)"""
+        state, _, changed_at = self._read()
+        if state == CLOSED:
+            return True
+        if time.time() - changed_at < self.reset_seconds:
+            self._reject()
+            return False
+
+        def probe(state, failures, changed_at, now):
+            # Only one caller gets to probe per interval; a lost probe is replaced after another interval
+            if state == CLOSED:
+                return (state, failures, changed_at), True
+            if now - changed_at < self.reset_seconds:
+                return (state, failures, changed_at), False
+            return (HALF_OPEN, failures, now), True
+
+        if self._update(probe):
+            return True
+        self._reject()
+        return False
+
+    def check(self):
+        """Raise CircuitOpenError unless a request may be sent now"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+
+    def record_success(self):
+        state, failures, _ = self._last
+        # The common case - nothing to reset - needs no write
+        if state == CLOSED and not failures:
+            return
+
+        def close(state, failures, changed_at, now):
+            return (CLOSED, 0, changed_at if state == CLOSED else now), None
+
+        self._update(close)
+
+    def record_failure(self):
+        """Count a failed attempt; returns True if the breaker is (now) open"""
+        def fail(state, failures, changed_at, now):
+            failures += 1
+            if state == HALF_OPEN or (state == CLOSED and failures >= self.failure_threshold):
+                return (OPEN, failures, now), True
+            return (state, failures, changed_at), state != CLOSED
+
+        return self._update(fail)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        REJECTED.inc(upstream=self.name)
+
+    # --- status ---
+    def state(self):
+        return self._read()[0]
+
+    def retry_in(self):
+        """Seconds until the next probe may be sent (0 if requests can go now)"""
+        state, _, changed_at = self._last
+        if state == CLOSED:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.time() - changed_at))
+
+    def available(self):
+        """True if closed, or open long enough that a probe would be let through"""
+        state, _, changed_at = self._read()
+        return state == CLOSED or time.time() - changed_at >= self.reset_seconds
+
+    def stats(self):
+        state, failures, _ = self._read()
+        return {
+            "state": state,
+            "consecutive_failures": failures,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "rejected": self.rejected,
+        }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream):
+    """Return the process-wide breaker for an upstream, configured from the environment"""
+    with _breakers_lock:
+        breaker = _breakers.get(upstream)
+        if breaker is None:
+            try:
+                threshold = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", str(DEFAULT_FAILURE_THRESHOLD)))
+            except ValueError:
+                threshold = DEFAULT_FAILURE_THRESHOLD
+            try:
+                reset = float(os.environ.get("CIRCUIT_RESET_SECONDS", str(DEFAULT_RESET_SECONDS)))
+            except ValueError:
+                reset = DEFAULT_RESET_SECONDS
+            path = os.environ.get("CIRCUIT_STATE_PATH", "circuits.db")
+            breaker = _breakers[upstream] = CircuitBreaker(upstream, threshold, reset, path=path or None)
+        return breaker
@@ -0,0 +1,109 @@
+"""
+Micro-batching coalescer for per-item API calls.
+
+Callers on different threads ask for one item at a time (a phone number to
+check against TPS, a company to read from HubSpot, ...). Pending items are
+collected for a short window (or until a maximum count is reached) and sent as
+a single batch request; each caller then receives the result for the item it
+asked about.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Coalescer:
+    """Collects single-item lookups into batched requests"""
+
+    def __init__(self, batch_fn, window=0.05, max_batch=500, max_inflight=2, name="coalescer"):
+        # batch_fn(keys) -> list of results in the same order as keys
+        self.batch_fn = batch_fn
+        self.window = max(0.0, float(window))
+        self.max_batch = max(1, int(max_batch))
+        self.max_inflight = max(1, int(max_inflight))
+        self.name = name
+        self._pending = []
+        self._first_at = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._pid = None
+        self.batches_sent = 0
+        self.items_sent = 0
+        self.requests = 0
+
+    def check(self, key, timeout=30):
+        """Look up one item, blocking until its batch has been answered"""
+        return self.submit(key).result(timeout=timeout)
+
+    def submit(self, key):
+        """Queue one item and return a Future for its result"""
+        fut = Future()
+        self.requests += 1
+        if self.window == 0:
+            # Coalescing disabled - send straight through
+            self._send([(key, fut)])
+            return fut
+        self._ensure_started()
+        with self._cond:
+            if not self._pending:
+                self._first_at = time.monotonic()
+            self._pending.append((key, fut))
+            self._cond.notify()
+        return fut
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches_sent": self.batches_sent,
+            "items_sent": self.items_sent,
+            "window_ms": int(self.window * 1000),
+            "max_batch": self.max_batch,
+        }
+
+    # --- internals ---
+    def _ensure_started(self):
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            # (Re)start after import or after a fork into a gunicorn worker
+            self._pid = os.getpid()
+            self._pending = []
+            self._executor = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix=f"{self.name}-batch")
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Wait out the window unless the batch fills up first
+                while len(self._pending) < self.max_batch:
+                    remaining = self._first_at + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                self._first_at = time.monotonic() if self._pending else None
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        # The same item may be asked for by several callers - send it once
+        unique = list(dict.fromkeys(key for key, _ in batch))
+        try:
+            results = self.batch_fn(unique)
+            self.batches_sent += 1
+            self.items_sent += len(unique)
+            by_key = {}
+            for idx, key in enumerate(unique):
+                by_key[key] = results[idx] if results and idx < len(results) else None
+            for key, fut in batch:
+                fut.set_result(by_key.get(key))
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
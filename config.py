@@ -0,0 +1,33 @@
+"""
+Environment loading shared by the webhook server, the CLI and the scripts.
+
+Several modules read their settings from the environment when they are
+imported (http_client, rate_limiter, metrics, ...), so load_env() has to run
+before they are imported; this module has no dependencies for that reason.
+"""
+
+import os
+from pathlib import Path
+
+ENV_FILE = Path(__file__).resolve().parent / "env" / ".env"
+
+
+def load_env():
+    """Load env/.env into the environment if python-dotenv is installed (OS variables win)"""
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=str(ENV_FILE))
+    except Exception:
+        pass
+
+
+def env_int(name, default):
+    """Integer setting, falling back to default if unset or malformed"""
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def env_flag(name):
+    return os.environ.get(name, "").strip().lower() in ("1", "true", "yes")
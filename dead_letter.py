@@ -0,0 +1,173 @@
+"""
+Durable dead-letter queue for webhook work that failed during an outage.
+
+Events whose TPS check or HubSpot lookup failed, and HubSpot updates that
+could not be written, are kept on disk (a SharedQueue in DEAD_LETTER_PATH)
+instead of being dropped. A replay thread in each webhook process hands them
+back to the worker pool once the upstream circuit breakers are closed, at no
+more than DEAD_LETTER_REPLAY_PER_SEC; while a breaker is open but due for a
+probe, one item is replayed at a time so the replay itself can close it.
+
+Items that keep failing are retried with exponential backoff, and after
+DEAD_LETTER_MAX_ATTEMPTS they are parked (kept, but no longer replayed) for
+someone to look at:
+
+    python dead_letter.py stats
+    python dead_letter.py requeue     # replay parked items again
+"""
+
+import os
+import sys
+import threading
+import time
+
+import metrics
+import tracing
+from shared_queue import SharedQueue
+
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_RETRY_SECONDS = 30.0
+DEFAULT_RETRY_MAX_SECONDS = 3600.0
+
+ADDED = metrics.Counter("tps_dead_letters_total", "Items added to the dead-letter queue", labels=("reason",))
+REPLAYED = metrics.Counter("tps_dead_letters_replayed_total", "Dead-letter items handed back to the workers")
+DEPTH = metrics.Gauge("tps_dead_letter_depth", "Items waiting in the dead-letter queue", merge="max")
+log = tracing.get_logger("dead_letter")
+
+
+class DeadLetterQueue:
+    """Failed items on disk, replayed with backoff once the upstreams recover"""
+
+    def __init__(self, path="dead_letters.db", name="webhook", max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 retry_seconds=DEFAULT_RETRY_SECONDS, retry_max_seconds=DEFAULT_RETRY_MAX_SECONDS):
+        self.queue = SharedQueue(path, name=name)
+        self.parked = SharedQueue(path, name=f"{name}-parked")
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_seconds = float(retry_seconds)
+        self.retry_max_seconds = float(retry_max_seconds)
+        self.added = 0
+        self.replayed = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        def number(name, default):
+            try:
+                return float(os.environ.get(name, str(default)))
+            except ValueError:
+                return default
+
+        return cls(
+            os.environ.get("DEAD_LETTER_PATH", "dead_letters.db"),
+            max_attempts=number("DEAD_LETTER_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+            retry_seconds=number("DEAD_LETTER_RETRY_SECONDS", DEFAULT_RETRY_SECONDS),
+            retry_max_seconds=number("DEAD_LETTER_RETRY_MAX_SECONDS", DEFAULT_RETRY_MAX_SECONDS),
+        )
+
+    def add(self, item, reason):
+        """
+        Store a failed item (a JSON-able dict). It becomes due for replay after a
+        backoff that grows with each failed attempt; returns False if it was parked.
+        """
+        attempts = int(item.get("_dead_letter_attempts") or 0) + 1
+        item = {**item, "_dead_letter_attempts": attempts, "_dead_letter_reason": str(reason)[:200]}
+        with self._lock:
+            self.added += 1
+        ADDED.inc(reason=str(reason).split(":", 1)[0][:40])
+        if attempts > self.max_attempts:
+            self.parked.put(item)
+            return False
+        delay = 0.0 if attempts == 1 else min(self.retry_max_seconds, self.retry_seconds * 2 ** (attempts - 2))
+        self.queue.put(item, delay=delay)
+        return True
+
+    def depth(self):
+        return self.queue.depth()
+
+    def stats(self):
+        return {
+            "waiting": self.queue.depth(),
+            "parked": self.parked.depth(),
+            "added": self.added,
+            "replayed": self.replayed,
+        }
+
+    def requeue_parked(self, limit=100_000):
+        """Give parked items a fresh set of attempts; returns how many were moved"""
+        moved = 0
+        while moved < limit:
+            claimed = self.parked.claim(min(500, limit - moved))
+            if not claimed:
+                break
+            self.queue.put_many([{**item, "_dead_letter_attempts": 0} for _, item in claimed])
+            self.parked.ack([job_id for job_id, _ in claimed])
+            moved += len(claimed)
+        return moved
+
+    # --- replay ---
+    def start_replay(self, submit, breakers, rate_per_sec=5.0, free_slots=None):
+        """
+        Start this process's replay thread (idempotent, and safe after a fork).
+        submit(item) hands an item to the workers and returns False if they are
+        full; free_slots() caps how many are handed over at once.
+        """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(
+            target=self._run_replay, args=(submit, tuple(breakers), max(0.1, float(rate_per_sec)), free_slots),
+            name="dead-letter-replay", daemon=True,
+        ).start()
+
+    def _run_replay(self, submit, breakers, rate, free_slots):
+        pid = os.getpid()
+        interval = max(1.0, 1.0 / rate)
+        while pid == self._pid:
+            time.sleep(interval)
+            try:
+                if not all(b.available() for b in breakers):
+                    continue
+                if all(b.state() == "closed" for b in breakers):
+                    limit = max(1, int(rate * interval))
+                else:
+                    # A breaker is due a probe: let one replayed item be it
+                    limit = 1
+                if free_slots is not None:
+                    limit = min(limit, free_slots())
+                claimed = self.queue.claim(limit)
+                done, returned = [], []
+                for job_id, item in claimed:
+                    (done if submit(item) else returned).append(job_id)
+                self.queue.ack(done)
+                self.queue.release(returned)
+                if done:
+                    with self._lock:
+                        self.replayed += len(done)
+                    REPLAYED.inc(len(done))
+                DEPTH.set(self.queue.depth())
+            except Exception as e:
+                log.error("dead-letter replay error", error=str(e)[:100])
+
+
+def main(argv=None):
+    import argparse
+
+    from config import load_env
+
+    load_env()
+    parser = argparse.ArgumentParser(description="Inspect the webhook dead-letter queue")
+    parser.add_argument("command", choices=("stats", "requeue"))
+    args = parser.parse_args(argv)
+    dead_letters = DeadLetterQueue.from_env()
+    if args.command == "requeue":
+        print(f"✓ Requeued {dead_letters.requeue_parked()} parked item(s)")
+    stats = dead_letters.stats()
+    print(f"Waiting for replay: {stats['waiting']}")
+    print(f"Parked: {stats['parked']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Webhook idempotency and per-object coalescing store.
+
+HubSpot redelivers events (same eventId) and users often edit the same company
+several times in a row. Both are handled here with a small SQLite database
+that every gunicorn worker shares:
+
+- processed_events remembers eventIds for a limited time so redeliveries are
+  dropped, bounded by a TTL and a maximum number of rows.
+- pending_objects holds the latest event per objectId while a check for that
+  object is waiting to run, so later events for the same object are folded
+  into it instead of triggering checks of their own.
+"""
+
+import json
+import threading
+import time
+
+import state_backend
+
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 100_000
+_PURGE_EVERY = 500
+
+
+class EventStore:
+    """Shared, time-expiring record of seen events and pending objects"""
+
+    def __init__(self, path="webhook_state.db", ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = str(path)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.duplicates = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._marks_since_purge = 0
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_events ("
+                " event_id TEXT PRIMARY KEY,"
+                " seen_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_events_seen_at ON processed_events (seen_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_objects ("
+                " object_id TEXT PRIMARY KEY,"
+                " event TEXT NOT NULL,"
+                " occurred_at REAL NOT NULL,"
+                " staged_at REAL NOT NULL)"
+            )
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=True)
+
+    # --- idempotency ---
+    def mark_event(self, event_id):
+        """Record an eventId; returns False if it was already seen within the TTL"""
+        if event_id is None:
+            return True
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT seen_at FROM processed_events WHERE event_id = ?", (str(event_id),)
+            ).fetchone()
+            if row and row[0] >= now - self.ttl_seconds:
+                conn.execute("COMMIT")
+                with self._lock:
+                    self.duplicates += 1
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO processed_events (event_id, seen_at) VALUES (?, ?)",
+                (str(event_id), now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._marks_since_purge += 1
+            due = self._marks_since_purge >= _PURGE_EVERY
+            if due:
+                self._marks_since_purge = 0
+        if due:
+            self.purge()
+        return True
+
+    def unmark_event(self, event_id):
+        """Forget an eventId (e.g. it couldn't be queued, so HubSpot must retry it)"""
+        if event_id is None:
+            return
+        self._conn().execute("DELETE FROM processed_events WHERE event_id = ?", (str(event_id),))
+
+    def purge(self):
+        """Drop expired eventIds and trim the table to max_entries"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM processed_events WHERE seen_at < ?", (time.time() - self.ttl_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM processed_events").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM processed_events WHERE event_id IN"
+                    " (SELECT event_id FROM processed_events ORDER BY seen_at ASC LIMIT ?)",
+                    (excess,),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM processed_events").fetchone()[0]
+
+    # --- per-object coalescing ---
+    def stage_object(self, object_id, event, stale_after=300):
+        """
+        Store event as the latest for object_id. Returns True if the caller
+        should schedule a check, or False if one is already pending and this
+        event has been folded into it.
+        """
+        now = time.time()
+        occurred_at = float(event.get("occurredAt") or now * 1000)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT occurred_at, staged_at FROM pending_objects WHERE object_id = ?", (str(object_id),)
+            ).fetchone()
+            # A pending row older than stale_after belongs to a worker that died - take it over
+            if row is None or row[1] < now - stale_after:
+                conn.execute(
+                    "INSERT OR REPLACE INTO pending_objects (object_id, event, occurred_at, staged_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    (str(object_id), json.dumps(event), occurred_at, now),
+                )
+                conn.execute("COMMIT")
+                return True
+            if occurred_at >= row[0]:
+                conn.execute(
+                    "UPDATE pending_objects SET event = ?, occurred_at = ? WHERE object_id = ?",
+                    (json.dumps(event), occurred_at, str(object_id)),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.coalesced += 1
+        return False
+
+    def unstage_object(self, object_id):
+        self._conn().execute("DELETE FROM pending_objects WHERE object_id = ?", (str(object_id),))
+
+    def take_object(self, object_id):
+        """Claim the latest pending event for object_id (None if already taken)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT event FROM pending_objects WHERE object_id = ?", (str(object_id),)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM pending_objects WHERE object_id = ?", (str(object_id),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        return {
+            "duplicates": self.duplicates,
+            "coalesced": self.coalesced,
+        }
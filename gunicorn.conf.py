@@ -0,0 +1,28 @@
+"""
+Gunicorn settings for the webhook service (Procfile: gunicorn app:app -c gunicorn.conf.py).
+
+Workers share their state through the state backend (see state_backend.py),
+so any number of processes can run side by side. Each process serves
+requests on GUNICORN_THREADS threads (the gthread worker class): the webhook
+endpoint only parses and queues events, and the outbound TPS and HubSpot calls
+run on the webhook worker pool, so a few processes with threads go further
+than many single-threaded sync workers. Another class can be chosen with
+GUNICORN_WORKER_CLASS (e.g. "sync", or "gevent" if gevent is installed).
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+
+def post_worker_init(worker):
+    # Drain the shared queue (and replay dead letters) from the start rather than from the
+    # first request, so events left by a previous deploy are picked up even if no new webhooks arrive
+    import app
+
+    app.start_background_workers()
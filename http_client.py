@@ -0,0 +1,191 @@
+"""
+Shared HTTP client for all outbound HubSpot and TPS calls.
+
+Each upstream gets its own pooled requests.Session (kept per process, so
+gunicorn workers don't share sockets after a fork), consistent connect/read
+timeouts, and one retry policy: 429 and 5xx responses and connection errors
+are retried with exponential backoff and full jitter, honouring Retry-After
+when the server sends it. Every attempt first takes a token from the
+upstream's shared rate limiter, and every response is fed back to it.
+Attempts also go through the upstream's circuit breaker: while it is open,
+requests raise CircuitOpenError at once, and a retry loop stops as soon as
+its own failures open the breaker. A caller that treats a read timeout as
+a sign its request was too large (retry_timeouts=False) gets it raised at
+once, neither retried nor counted against the breaker.
+Each attempt's latency and outcome is recorded in metrics, labelled by
+upstream and operation (TPS check, HubSpot read, write or search).
+"""
+
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import tracing
+from circuit_breaker import CircuitOpenError, get_breaker
+from rate_limiter import get_limiter
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Rate-limit buckets that share another upstream's circuit breaker
+BREAKERS = {"hubspot_search": "hubspot"}
+
+log = tracing.get_logger("http")
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return int(default)
+
+
+CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", "5")
+READ_TIMEOUT = _env_float("HTTP_READ_TIMEOUT", "30")
+MAX_RETRIES = _env_int("HTTP_MAX_RETRIES", "4")
+BACKOFF_BASE = _env_float("HTTP_BACKOFF_BASE", "0.5")
+BACKOFF_MAX = _env_float("HTTP_BACKOFF_MAX", "30")
+
+POOL_SIZES = {
+    "hubspot": _env_int("HUBSPOT_POOL_SIZE", "10"),
+    "tps": _env_int("TPS_POOL_SIZE", "4"),
+}
+
+REQUEST_SECONDS = metrics.Histogram(
+    "tps_http_request_duration_seconds", "Outbound HTTP request latency per attempt",
+    labels=("upstream", "operation"),
+)
+RESPONSES = metrics.Counter(
+    "tps_http_responses_total", "Outbound HTTP responses by status code (error = no response)",
+    labels=("upstream", "operation", "status"),
+)
+
+_sessions = {}
+_sessions_pid = None
+_sessions_lock = threading.Lock()
+
+
+def get_session(upstream):
+    """Return the pooled session for an upstream ("hubspot" or "tps")"""
+    global _sessions, _sessions_pid
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            _sessions = {}
+            _sessions_pid = os.getpid()
+        session = _sessions.get(upstream)
+        if session is None:
+            size = POOL_SIZES.get(upstream, 10)
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[upstream] = session
+        return session
+
+
+def retry_after_seconds(response):
+    """Parse a Retry-After header (seconds or HTTP date); None if absent"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, response=None):
+    """Delay before retry number attempt (1-based)"""
+    retry_after = retry_after_seconds(response)
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX) + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _operation(upstream, method, url):
+    if upstream == "tps":
+        return "check"
+    path = url.split("?", 1)[0].rstrip("/")
+    if path.endswith("/batch/update") or method.upper() in ("PATCH", "PUT", "DELETE"):
+        return "write"
+    if path.endswith("/search"):
+        return "search"
+    return "read"
+
+
+def request(upstream, method, url, retries=None, timeout=None, retry_timeouts=True, **kwargs):
+    """
+    Send a request through the upstream's pooled session, retrying 429/5xx
+    and connection errors. Returns the final response (whatever its status);
+    raises the last requests exception if every attempt failed to connect,
+    or CircuitOpenError (a requests.ConnectionError) while the upstream is down.
+    With retry_timeouts=False a read timeout is raised straight away and left
+    to the caller, without counting as an upstream failure.
+    """
+    retries = MAX_RETRIES if retries is None else retries
+    timeout = timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+    session = get_session(upstream)
+    limiter = get_limiter(upstream)
+    breaker = get_breaker(BREAKERS.get(upstream, upstream))
+    operation = _operation(upstream, method, url)
+    attempt = 0
+    while True:
+        breaker.check()
+        limiter.acquire()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            REQUEST_SECONDS.observe(time.perf_counter() - started, upstream=upstream, operation=operation)
+            RESPONSES.inc(upstream=upstream, operation=operation, status="error")
+            if not retry_timeouts and isinstance(e, requests.ReadTimeout):
+                raise
+            attempt += 1
+            if breaker.record_failure():
+                raise CircuitOpenError(breaker.name, breaker.retry_in()) from e
+            if attempt > retries:
+                raise
+            delay = backoff_delay(attempt)
+            log.warning("retrying request", upstream=upstream, error=type(e).__name__,
+                        delay_s=round(delay, 1), attempt=attempt, retries=retries)
+            time.sleep(delay)
+            continue
+
+        REQUEST_SECONDS.observe(time.perf_counter() - started, upstream=upstream, operation=operation)
+        RESPONSES.inc(upstream=upstream, operation=operation, status=response.status_code)
+        limiter.observe(response)
+        if response.status_code >= 500:
+            if breaker.record_failure():
+                return response
+        else:
+            breaker.record_success()
+        if response.status_code not in RETRY_STATUS or attempt >= retries:
+            return response
+        attempt += 1
+        delay = backoff_delay(attempt, response)
+        log.warning("retrying request", upstream=upstream, status=response.status_code,
+                    delay_s=round(delay, 1), attempt=attempt, retries=retries)
+        time.sleep(delay)
+
+
+def hubspot_request(method, url, **kwargs):
+    return request("hubspot", method, url, **kwargs)
+
+
+def tps_request(method, url, **kwargs):
+    return request("tps", method, url, **kwargs)
@@ -0,0 +1,219 @@
+"""
+HubSpot CRM v3 read helpers.
+
+batch_read fetches properties for many objects with the batch read endpoint
+({object endpoint}/batch/read), up to 100 IDs per request, instead of one GET
+per object. iter_objects pages through every object of a type as a generator,
+so callers can start work on the first page before the last one arrives;
+iter_pages exposes the paging cursor of each page so a run can resume.
+
+iter_objects_partitioned is the parallel alternative for the initial export:
+it splits the hs_object_id space into ranges and pages each range through the
+CRM search API concurrently, under the shared search rate limit.
+
+iter_modified_since drives delta syncs: it asks search only for objects
+modified at or after a watermark, oldest first.
+"""
+
+from datetime import datetime
+
+from http_client import hubspot_request, request
+from pipeline import merge, prefetch
+
+HUBSPOT_BATCH_LIMIT = 100
+SEARCH_PAGE_LIMIT = 200
+SEARCH_RESULT_CAP = 10_000
+
+
+def batch_read(endpoint, access_token, object_ids, properties):
+    """Return {object_id: {property: value}} for the objects HubSpot found"""
+    url = f"{endpoint.rstrip('/')}/batch/read"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+    ids = list(dict.fromkeys(str(i) for i in object_ids if i))
+    found = {}
+    for i in range(0, len(ids), HUBSPOT_BATCH_LIMIT):
+        chunk = ids[i:i + HUBSPOT_BATCH_LIMIT]
+        payload = {
+            "properties": list(properties),
+            "inputs": [{"id": object_id} for object_id in chunk],
+        }
+        r = hubspot_request("POST", url, headers=headers, json=payload)
+        # 207 means some IDs weren't found; the rest are still in results
+        if r.status_code not in (200, 207):
+            raise Exception(f"HubSpot batch read returned {r.status_code}: {r.text[:200]}")
+        for obj in r.json().get("results", []):
+            found[str(obj.get("id"))] = obj.get("properties", {}) or {}
+    return found
+
+
+def iter_pages(endpoint, access_token, properties, limit=100, after=None):
+    """
+    Yield (cursor, objects) for each page of the list endpoint, starting at
+    the paging cursor after. cursor is the value that fetched that page, so
+    passing it back as after re-reads the same page.
+    """
+    url = f"{endpoint.rstrip('/')}?properties={','.join(properties)}&limit={limit}"
+    headers = {"Authorization": f"Bearer {access_token}"}
+    while True:
+        page_url = f"{url}&after={after}" if after else url
+        r = hubspot_request("GET", page_url, headers=headers)
+        if r.status_code != 200:
+            raise Exception(f"HubSpot returned {r.status_code}: {r.text[:200]}")
+        data = r.json()
+        yield after, data.get("results", [])
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            return
+
+
+def iter_objects(endpoint, access_token, properties, limit=100, after=None):
+    """Yield every object from the list endpoint, one page at a time"""
+    for _, objects in iter_pages(endpoint, access_token, properties, limit, after):
+        yield from objects
+
+
+def search_page(endpoint, access_token, body):
+    """Run one CRM search request (search has its own rate limit bucket)"""
+    url = f"{endpoint.rstrip('/')}/search"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+    }
+    r = request("hubspot_search", "POST", url, headers=headers, json=body)
+    if r.status_code != 200:
+        raise Exception(f"HubSpot search returned {r.status_code}: {r.text[:200]}")
+    return r.json()
+
+
+def _object_id_bound(endpoint, access_token, direction):
+    body = {
+        "sorts": [{"propertyName": "hs_object_id", "direction": direction}],
+        "properties": ["hs_object_id"],
+        "limit": 1,
+    }
+    results = search_page(endpoint, access_token, body).get("results", [])
+    return int(results[0]["id"]) if results else None
+
+
+def iter_id_range(endpoint, access_token, properties, low, high):
+    """
+    Yield every object with low <= hs_object_id <= high in ID order.
+
+    Pages with a keyset (hs_object_id > last seen ID) rather than the search
+    "after" cursor, so a range isn't cut off at search's 10,000-result cap.
+    """
+    last_id = low - 1
+    while True:
+        body = {
+            "filterGroups": [{"filters": [
+                {"propertyName": "hs_object_id", "operator": "GT", "value": str(last_id)},
+                {"propertyName": "hs_object_id", "operator": "LTE", "value": str(high)},
+            ]}],
+            "sorts": [{"propertyName": "hs_object_id", "direction": "ASCENDING"}],
+            "properties": list(properties),
+            "limit": SEARCH_PAGE_LIMIT,
+        }
+        results = search_page(endpoint, access_token, body).get("results", [])
+        for obj in results:
+            yield obj
+        if len(results) < SEARCH_PAGE_LIMIT:
+            return
+        last_id = int(results[-1]["id"])
+
+
+def iter_objects_partitioned(endpoint, access_token, properties, partitions=8, workers=4, buffer=1000):
+    """
+    Yield every object by splitting the hs_object_id space into ranges and
+    exporting the ranges concurrently. The ranges are disjoint and each is
+    paged to exhaustion, so the merged stream has no duplicates or gaps.
+    """
+    low = _object_id_bound(endpoint, access_token, "ASCENDING")
+    high = _object_id_bound(endpoint, access_token, "DESCENDING")
+    if low is None or high is None:
+        return
+    partitions = max(1, min(int(partitions), high - low + 1))
+    step = (high - low + 1) / partitions
+    bounds = [low + int(i * step) for i in range(partitions)] + [high + 1]
+    ranges = [
+        iter_id_range(endpoint, access_token, properties, bounds[i], bounds[i + 1] - 1)
+        for i in range(partitions)
+    ]
+    yield from merge(ranges, workers=workers, maxsize=buffer, name="hubspot-export")
+
+
+def iter_all_objects(endpoint, access_token, properties, partitions=1, workers=4, buffer=1000):
+    """Yield every object, with a partitioned parallel export when partitions > 1"""
+    if partitions > 1:
+        return iter_objects_partitioned(endpoint, access_token, properties, partitions, workers, buffer)
+    return prefetch(iter_objects(endpoint, access_token, properties), maxsize=buffer, name="hubspot-fetch")
+
+
+def modified_millis(obj, date_property):
+    """Return an object's date_property as epoch milliseconds (None if missing or unparseable)"""
+    value = (obj.get("properties") or {}).get(date_property)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+def iter_modified_since(endpoint, access_token, properties, since_ms, date_property="lastmodifieddate"):
+    """
+    Yield every object whose date_property is at or after since_ms (epoch
+    milliseconds), in ascending modification order.
+
+    Search can't page past 10,000 results, so before the cap the query is
+    restarted from the last modification time seen; objects already yielded
+    at exactly that time are skipped so nothing is returned twice.
+    """
+    properties = list(dict.fromkeys(list(properties) + [date_property]))
+    since = int(since_ms)
+    operator = "GTE"
+    skip_ids = set()
+    while True:
+        last_ms, ids_at_last = since, set(skip_ids)
+        after = 0
+        while True:
+            body = {
+                "filterGroups": [{"filters": [
+                    {"propertyName": date_property, "operator": operator, "value": str(since)},
+                ]}],
+                "sorts": [{"propertyName": date_property, "direction": "ASCENDING"}],
+                "properties": properties,
+                "limit": SEARCH_PAGE_LIMIT,
+            }
+            if after:
+                body["after"] = str(after)
+            data = search_page(endpoint, access_token, body)
+            for obj in data.get("results", []):
+                modified = modified_millis(obj, date_property)
+                if modified is None:
+                    modified = last_ms
+                if modified != last_ms:
+                    last_ms, ids_at_last = modified, set()
+                if obj["id"] in ids_at_last:
+                    continue
+                ids_at_last.add(obj["id"])
+                yield obj
+            next_after = data.get("paging", {}).get("next", {}).get("after")
+            if not next_after:
+                return
+            after = int(next_after)
+            if after + SEARCH_PAGE_LIMIT > SEARCH_RESULT_CAP:
+                break
+
+        if last_ms == since:
+            # A whole result window shares one timestamp - the only way forward is past it
+            print(f"⚠ More than {SEARCH_RESULT_CAP} objects modified at {since}; some may be skipped")
+            since, operator, skip_ids = last_ms, "GT", set()
+        else:
+            since, operator, skip_ids = last_ms, "GTE", ids_at_last
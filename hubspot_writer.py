@@ -0,0 +1,301 @@
+"""
+Batched HubSpot property writer.
+
+Updates are queued per object and sent through the CRM v3 batch update
+endpoint ({object endpoint}/batch/update) in groups of up to 100. When a batch
+partly fails, only the failed IDs are retried; IDs HubSpot rejects outright
+(e.g. deleted objects or invalid values) are isolated and reported instead of
+sinking the rest of the batch. 429/5xx backoff is left to http_client.
+Updates that failed for a transient reason (network errors, 429/5xx after
+retries, an open circuit) are also passed to on_retryable, if given, so the
+caller can keep them for later instead of losing them.
+
+Given a ResultStore, the writer is diff-aware: properties HubSpot is already
+known to hold are dropped when queued, values it has never seen are read in
+one batch read per batch before sending, and successful writes are recorded
+as the new known values. Objects left with nothing to change are not written,
+which saves quota and the propertyChange webhook each write would trigger.
+"""
+
+import threading
+import time
+
+import requests
+
+import tracing
+from http_client import backoff_delay, hubspot_request
+from hubspot_reader import batch_read
+
+HUBSPOT_BATCH_LIMIT = 100
+
+log = tracing.get_logger("hubspot_writer")
+
+
+class HubSpotBatchWriter:
+    """Queues property updates and writes them with HubSpot batch update calls"""
+
+    def __init__(self, endpoint, access_token, batch_size=HUBSPOT_BATCH_LIMIT, max_retries=3,
+                 flush_interval=None, store=None, object_type=None, read_unknown=True, known_max_age=None,
+                 on_retryable=None):
+        self.endpoint = endpoint
+        self.access_token = access_token
+        self.url = f"{endpoint.rstrip('/')}/batch/update"
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+        self.batch_size = max(1, min(int(batch_size), HUBSPOT_BATCH_LIMIT))
+        self.max_retries = max_retries
+        self.flush_interval = flush_interval
+        self.store = store
+        self.object_type = object_type or endpoint.rstrip("/").rsplit("/", 1)[-1]
+        self.read_unknown = read_unknown
+        self.known_max_age = known_max_age
+        self.on_retryable = on_retryable
+        self._transient = set()
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._flusher = None
+        self.updated = 0
+        self.failed = {}
+        self.requests = 0
+        self.unchanged = 0
+
+    # --- producer side ---
+    def update(self, object_id, properties):
+        """
+        Queue a property update; sends a batch as soon as one is full. Returns
+        False if HubSpot already holds every value, so nothing was queued.
+        """
+        object_id = str(object_id)
+        known = self._known([object_id]).get(object_id, {})
+        with self._lock:
+            queued = self._pending.get(object_id, {})
+            # A queued value still has to be overwritten even if it's the one HubSpot holds
+            properties = {
+                k: v for k, v in properties.items()
+                if k in queued or k not in known or known[k] != _as_text(v)
+            }
+            if not properties:
+                self.unchanged += 1
+                return False
+            # HubSpot rejects duplicate IDs in one batch, so merge them
+            self._pending.setdefault(object_id, {}).update(properties)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            ready = len(self._pending) >= self.batch_size
+        if self.flush_interval is not None:
+            self._ensure_flusher()
+        if ready:
+            self._flush_full_batches()
+        return True
+
+    def flush(self):
+        """Send everything that is queued; returns (updated_ids, {id: reason})"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._oldest = None
+        return self._send_all(pending)
+
+    def pending(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "updated": self.updated,
+            "failed": len(self.failed),
+            "pending": self.pending(),
+            "requests": self.requests,
+            "unchanged": self.unchanged,
+        }
+
+    # --- internals ---
+    def _known(self, object_ids):
+        if self.store is None:
+            return {}
+        return self.store.synced_values(self.object_type, object_ids, self.known_max_age)
+
+    def _drop_unchanged(self, updates):
+        """Read values HubSpot hasn't been seen holding, and drop the ones already in place"""
+        known = self._known(updates)
+        unknown = {i for i, props in updates.items() if any(k not in known.get(i, {}) for k in props)}
+        if unknown and self.read_unknown:
+            properties = sorted({k for i in unknown for k in updates[i]})
+            try:
+                current = batch_read(self.endpoint, self.access_token, unknown, properties)
+            except Exception as e:
+                log.warning("could not read current HubSpot values", objects=len(unknown), error=str(e)[:100])
+                current = {}
+            seen = {i: {k: current[i].get(k) for k in properties} for i in current}
+            self.store.record_synced(self.object_type, seen)
+            for i, values in seen.items():
+                known.setdefault(i, {}).update({k: _as_text(v) for k, v in values.items()})
+        changed = {}
+        for i, props in updates.items():
+            props = {k: v for k, v in props.items() if k not in known.get(i, {}) or known[i][k] != _as_text(v)}
+            if props:
+                changed[i] = props
+        with self._lock:
+            self.unchanged += len(updates) - len(changed)
+        return changed
+
+    def _flush_full_batches(self):
+        with self._lock:
+            if len(self._pending) < self.batch_size:
+                return
+            ids = list(self._pending)[:len(self._pending) - len(self._pending) % self.batch_size]
+            ready = {i: self._pending.pop(i) for i in ids}
+            self._oldest = time.monotonic() if self._pending else None
+        self._send_all(ready)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name="hubspot-writer", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(min(self.flush_interval, 0.25))
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    log.error("HubSpot batch flush error", error=str(e)[:100])
+
+    def _send_all(self, updates):
+        updated = []
+        failed = {}
+        items = list(updates.items())
+        with self._send_lock:
+            for i in range(0, len(items), self.batch_size):
+                batch = dict(items[i:i + self.batch_size])
+                if self.store is not None:
+                    batch = self._drop_unchanged(batch)
+                    if not batch:
+                        continue
+                ok, bad = self._send_batch(batch)
+                updated.extend(ok)
+                failed.update(bad)
+                if self.store is not None and ok:
+                    written = {u: {k: _as_text(v) for k, v in batch[u].items()} for u in ok}
+                    self.store.record_synced(self.object_type, written)
+            retryable = {i: updates[i] for i in failed if i in self._transient}
+            self._transient.clear()
+        self.updated += len(updated)
+        self.failed.update(failed)
+        # Objects that failed earlier and have now been written (e.g. replayed after an outage)
+        for object_id in updated:
+            self.failed.pop(object_id, None)
+        if retryable and self.on_retryable is not None:
+            try:
+                self.on_retryable(retryable)
+            except Exception as e:
+                log.error("could not keep failed HubSpot updates", updates=len(retryable), error=str(e)[:100])
+        return updated, failed
+
+    def _send_batch(self, updates):
+        """Send one batch, retrying failed IDs; returns (updated_ids, {id: reason})"""
+        updated = []
+        failed = {}
+        attempt = 0
+        while updates:
+            inputs = [{"id": i, "properties": p} for i, p in updates.items()]
+            self.requests += 1
+            try:
+                r = hubspot_request("POST", self.url, headers=self.headers, json={"inputs": inputs})
+            except requests.RequestException as e:
+                status, body = None, {"message": str(e)}
+            else:
+                status = r.status_code
+                try:
+                    body = r.json()
+                except ValueError:
+                    body = {"message": r.text[:200]}
+
+            if status == 200:
+                updated.extend(updates)
+                return updated, failed
+
+            if status == 207:
+                # Multi-status: keep the successes, retry only what failed
+                done = {str(res.get("id")) for res in body.get("results", [])}
+                updated.extend(i for i in updates if i in done)
+                rejected = _error_ids(body)
+                for i in list(updates):
+                    if i in done:
+                        del updates[i]
+                    elif i in rejected:
+                        failed[i] = rejected[i]
+                        del updates[i]
+                attempt += 1
+                if updates and attempt > self.max_retries:
+                    break
+                if updates:
+                    time.sleep(backoff_delay(attempt))
+                continue
+
+            if status is None or status == 429 or status >= 500:
+                # http_client has already retried these
+                reason = f"{status or 'network error'}: {body.get('message', '')[:150]}"
+                for i in updates:
+                    failed[i] = reason
+                self._transient.update(updates)
+                return updated, failed
+
+            # Whole batch rejected (e.g. one bad ID or value) - isolate the culprits
+            rejected = _error_ids(body)
+            culprits = [i for i in updates if i in rejected]
+            if culprits:
+                for i in culprits:
+                    failed[i] = rejected[i]
+                    del updates[i]
+                continue
+            if len(updates) == 1:
+                (only,) = updates
+                failed[only] = f"{status}: {body.get('message', '')[:150]}"
+                return updated, failed
+            items = list(updates.items())
+            half = len(items) // 2
+            for part in (dict(items[:half]), dict(items[half:])):
+                ok, bad = self._send_batch(part)
+                updated.extend(ok)
+                failed.update(bad)
+            return updated, failed
+
+        for i in updates:
+            failed[i] = "retries exhausted"
+        self._transient.update(updates)
+        return updated, failed
+
+
+def _error_ids(body):
+    """Map object IDs named in a HubSpot error response to their error message"""
+    errors = body.get("errors") if isinstance(body, dict) else None
+    if not errors and isinstance(body, dict) and body.get("context"):
+        errors = [body]
+    found = {}
+    for err in errors or []:
+        context = err.get("context") or {}
+        message = err.get("message") or err.get("category") or "error"
+        for key in ("ids", "id", "objectId"):
+            for i in context.get(key) or []:
+                found[str(i)] = message[:150]
+    return found
+
+
+def _as_text(value):
+    """HubSpot returns every property value as a string"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
@@ -0,0 +1,334 @@
+"""
+Service metrics in the Prometheus text format, shared across gunicorn workers.
+
+Each process records into in-memory counters, gauges and histograms - one
+lock and a few dict additions per observation, cheap enough for the webhook
+hot path. A background thread writes the process's totals to a small SQLite
+file every few seconds (one row per process and series), and render() sums
+the rows of every process, so whichever worker answers /metrics reports
+totals for the whole service. Counters from processes that have exited are
+folded into a single archive row so restarts never make totals go backwards.
+With METRICS_PATH empty, metrics stay per process.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import state_backend
+import tracing
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+# Gauges from a process that hasn't flushed for this long are dropped; its counters are archived
+STALE_SECONDS = 60.0
+_ARCHIVE = "archive"
+
+_families = {}
+_collectors = []
+_lock = threading.Lock()
+_values = {}  # (sample name, ((label, value), ...)) -> value, for this process
+_state = {
+    "pid": os.getpid(),
+    # PIDs get reused, so a process is identified by PID and start time
+    "process": f"{os.getpid()}-{time.time():.0f}",
+    "flusher": None,
+    "local": threading.local(),
+}
+log = tracing.get_logger("metrics")
+
+
+class _Family:
+    merge = "sum"
+
+    def __init__(self, name, help_text, kind, labels):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+        _families[name] = self
+
+    def _key(self, sample, labels, *extra):
+        return (sample, tuple((k, str(labels.get(k, ""))) for k in self.labels) + extra)
+
+
+class Counter(_Family):
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, "counter", labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(self.name, labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+        _ensure_flusher()
+
+
+class Gauge(_Family):
+    def __init__(self, name, help_text, labels=(), merge="sum"):
+        """merge="max" for values every process sees the same way (e.g. a shared queue's depth)"""
+        super().__init__(name, help_text, "gauge", labels)
+        self.merge = merge
+
+    def set(self, value, **labels):
+        key = self._key(self.name, labels)
+        with _lock:
+            _values[key] = value
+        _ensure_flusher()
+
+
+class Histogram(_Family):
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, "histogram", labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        keys = [self._key(f"{self.name}_bucket", labels, ("le", _format_le(b))) for b in self.buckets if value <= b]
+        keys.append(self._key(f"{self.name}_bucket", labels, ("le", "+Inf")))
+        count = self._key(f"{self.name}_count", labels)
+        total = self._key(f"{self.name}_sum", labels)
+        with _lock:
+            for key in keys:
+                _values[key] = _values.get(key, 0) + 1
+            _values[count] = _values.get(count, 0) + 1
+            _values[total] = _values.get(total, 0.0) + value
+        _ensure_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Ratio:
+    """A gauge computed at render time from the service-wide totals of two counters"""
+
+    def __init__(self, name, help_text, numerator, denominator):
+        self.name = name
+        self.help = help_text
+        self.kind = "gauge"
+        self.numerator = numerator
+        self.denominator = denominator
+        _families[name] = self
+
+
+def collector(fn):
+    """Register fn() to refresh gauges (e.g. queue depth) just before each flush"""
+    _collectors.append(fn)
+    return fn
+
+
+def _format_le(bound):
+    return repr(float(bound))
+
+
+# --- shared storage ---
+def _path():
+    return os.environ.get("METRICS_PATH", "metrics.db")
+
+
+def _conn():
+    local = _state["local"]
+    conn = state_backend.get_backend().connect(_path(), autocommit=True)
+    if getattr(local, "conn", None) is not conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS metrics ("
+            " process TEXT NOT NULL,"
+            " sample TEXT NOT NULL,"
+            " labels TEXT NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " value REAL NOT NULL,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (process, sample, labels))"
+        )
+        local.conn = conn
+    return conn
+
+
+def _process_id():
+    if _state["pid"] != os.getpid():
+        with _lock:
+            if _state["pid"] != os.getpid():
+                # Values inherited across a fork belong to the parent
+                _values.clear()
+                _state["pid"] = os.getpid()
+                _state["process"] = f"{os.getpid()}-{time.time():.0f}"
+                _state["flusher"] = None
+    return _state["process"]
+
+
+def _ensure_flusher():
+    flusher = _state["flusher"]
+    if flusher is not None and _state["pid"] == os.getpid():
+        return
+    if not _path():
+        return
+    process = _process_id()
+    with _lock:
+        if _state["flusher"] is None or not _state["flusher"].is_alive():
+            _state["flusher"] = threading.Thread(target=_run_flusher, name=f"metrics-{process}", daemon=True)
+            _state["flusher"].start()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            log.warning("metrics flush failed", error=str(e)[:100])
+
+
+def _collect():
+    for fn in list(_collectors):
+        try:
+            fn()
+        except Exception as e:
+            log.warning("metrics collector failed", error=str(e)[:100])
+
+
+def _family(sample):
+    family = _families.get(sample)
+    if family is None:
+        for suffix in ("_bucket", "_count", "_sum"):
+            if sample.endswith(suffix):
+                family = _families.get(sample[: -len(suffix)])
+                break
+    return family
+
+
+def _kind(sample):
+    family = _family(sample)
+    return family.kind if family else "counter"
+
+
+def flush():
+    """Write this process's totals to the shared file, archiving processes that have gone away"""
+    if not _path():
+        return
+    _collect()
+    process = _process_id()
+    now = time.time()
+    with _lock:
+        snapshot = list(_values.items())
+    rows = [(process, sample, _labels_json(pairs), _kind(sample), value, now) for (sample, pairs), value in snapshot]
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO metrics (process, sample, labels, kind, value, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        stale = now - STALE_SECONDS
+        conn.execute("DELETE FROM metrics WHERE kind = 'gauge' AND updated < ?", (stale,))
+        dead = conn.execute(
+            "SELECT sample, labels, SUM(value) FROM metrics"
+            " WHERE process != ? AND updated < ? GROUP BY sample, labels",
+            (_ARCHIVE, stale),
+        ).fetchall()
+        if dead:
+            conn.executemany(
+                "INSERT INTO metrics (process, sample, labels, kind, value, updated) VALUES (?, ?, ?, 'counter', ?, ?)"
+                " ON CONFLICT (process, sample, labels) DO UPDATE SET value = value + excluded.value",
+                [(_ARCHIVE, sample, labels, value, now) for sample, labels, value in dead],
+            )
+            conn.execute("DELETE FROM metrics WHERE process != ? AND updated < ?", (_ARCHIVE, stale))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+@atexit.register
+def _flush_at_exit():
+    # Short-lived processes (the batch scripts) would otherwise lose the last interval
+    if _values and _state["pid"] == os.getpid():
+        try:
+            flush()
+        except Exception as e:
+            log.warning("metrics flush failed", error=str(e)[:100])
+
+
+def totals():
+    """Return {(sample, labels json): value} summed (or maxed) over every live and archived process"""
+    if not _path():
+        _collect()
+        with _lock:
+            return {(sample, _labels_json(pairs)): value for (sample, pairs), value in _values.items()}
+    flush()
+    rows = _conn().execute("SELECT sample, labels, SUM(value), MAX(value) FROM metrics GROUP BY sample, labels")
+    return {
+        (sample, labels): highest if getattr(_family(sample), "merge", "sum") == "max" else total
+        for sample, labels, total, highest in rows
+    }
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format"""
+    values = totals()
+    by_sample = {}
+    for (sample, labels), value in values.items():
+        by_sample.setdefault(sample, []).append((labels, value))
+
+    lines = []
+    for name, family in _families.items():
+        if isinstance(family, Ratio):
+            num = sum(v for (s, _), v in values.items() if s == family.numerator)
+            den = sum(v for (s, _), v in values.items() if s == family.denominator)
+            samples = {name: [("{}", num / den if den else 0.0)]}
+        elif family.kind == "histogram":
+            samples = {s: by_sample.get(s, []) for s in (f"{name}_bucket", f"{name}_sum", f"{name}_count")}
+            samples[f"{name}_bucket"] = _all_buckets(family, samples[f"{name}_bucket"], samples[f"{name}_count"])
+        else:
+            samples = {name: by_sample.get(name, [])}
+        lines.append(f"# HELP {name} {family.help}")
+        lines.append(f"# TYPE {name} {family.kind}")
+        for sample, series in samples.items():
+            for labels, value in sorted(series, key=lambda item: _sort_key(item[0])):
+                lines.append(f"{sample}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels_json(pairs):
+    return json.dumps(dict(pairs), sort_keys=True)
+
+
+def _all_buckets(family, buckets, counts):
+    """Fill in empty buckets so every bound is exposed for every label set"""
+    have = {labels: value for labels, value in buckets}
+    filled = []
+    for labels, _ in counts:
+        base = json.loads(labels)
+        for le in [_format_le(b) for b in family.buckets] + ["+Inf"]:
+            key = json.dumps({**base, "le": le}, sort_keys=True)
+            filled.append((key, have.get(key, 0)))
+    return filled
+
+
+def _sort_key(labels):
+    parsed = json.loads(labels)
+    le = parsed.pop("le", None)
+    bound = float("inf") if le == "+Inf" else float(le) if le is not None else 0.0
+    return (json.dumps(parsed, sort_keys=True), bound)
+
+
+def _format_labels(labels):
+    parsed = {k: v for k, v in json.loads(labels).items() if v != ""}
+    if not parsed:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in parsed.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+"""
+Local stand-ins for the TPS and HubSpot APIs, for benchmarking without
+touching the real (billed) services.
+
+One HTTP server answers both:
+
+- HubSpot CRM v3 objects under /crm/v3/objects/<type>: GET paging (limit,
+  after, properties), POST /batch/read, POST /batch/update and POST /search
+  (filters on hs_object_id / lastmodifieddate / hs_lastmodifieddate, sorts,
+  and the 10,000 result cap)
+- TPS checks: any other POST with {"phone_numbers": [...]}
+
+The portal is synthetic: record i has ID FIRST_ID + i and a last-modified time
+that grows with i, and its properties are generated on demand, so a portal of
+a million records costs no memory until values are written to it. Written
+values are kept and returned by later reads.
+
+Latency, error rate and a requests-per-second limit (429 with Retry-After,
+plus X-HubSpot-RateLimit-* headers on HubSpot responses) can be set per
+upstream. TPS latency can also grow with the numbers per request, and requests
+above a size can be refused with 413, to exercise adaptive batch sizing, and
+a share of numbers can be refused with a 400 for the whole request, to
+exercise fault isolation.
+GET /_stats returns call counts; POST /_reset clears them.
+
+    python mock_apis.py --records 100000 --port 8090 --tps-latency-ms 200
+
+webhook_bursts() generates HubSpot webhook deliveries for the same portal.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIRST_ID = 100_000
+FIRST_MODIFIED_MS = 1_767_225_600_000  # 2026-01-01T00:00:00Z
+MODIFIED_STEP_MS = 1000
+SEARCH_RESULT_CAP = 10_000
+_OBJECT_PATH = re.compile(r"^/crm/v3/objects/([^/]+)(/batch/read|/batch/update|/search)?/?$")
+_DATE_PROPERTIES = ("lastmodifieddate", "hs_lastmodifieddate")
+
+
+def _iso(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{ms % 1000:03d}Z"
+
+
+def _millis(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return int(datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp() * 1000)
+
+
+class Portal:
+    """A synthetic HubSpot portal of n records per object type"""
+
+    def __init__(self, records, unique_numbers=None, invalid_rate=0.02, missing_rate=0.1, seed=0):
+        self.records = int(records)
+        # Fewer unique numbers than records means some records share a number
+        self.unique_numbers = int(unique_numbers or self.records)
+        self.invalid_rate = invalid_rate
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self._written = {}  # (object type, property) -> {index: value}
+        self._lock = threading.Lock()
+
+    def index(self, object_id):
+        try:
+            i = int(object_id) - FIRST_ID
+        except (TypeError, ValueError):
+            return None
+        return i if 0 <= i < self.records else None
+
+    def _number(self, i, kind):
+        n = (i * 2654435761 + self.seed + (7 if kind == "mobile" else 0)) % self.unique_numbers
+        roll = ((i * 40503 + self.seed) % 10_000) / 10_000
+        if roll < self.missing_rate:
+            return None
+        if roll < self.missing_rate + self.invalid_rate:
+            return "12345"
+        if kind == "mobile":
+            return f"07{700000000 + n % 99_999_999:09d}"
+        return f"020 {7000 + n // 10_000 % 3000:04d} {n % 10_000:04d}"
+
+    def properties(self, object_type, i, names):
+        modified = FIRST_MODIFIED_MS + i * MODIFIED_STEP_MS
+        values = {}
+        for name in names:
+            if name == "phone":
+                value = self._number(i, "phone")
+            elif name == "mobilephone":
+                value = self._number(i, "mobile") if i % 2 else None
+            elif name == "hs_object_id":
+                value = str(FIRST_ID + i)
+            elif name in _DATE_PROPERTIES:
+                value = _iso(modified)
+            else:
+                value = None
+            written = self._written.get((object_type, name))
+            if written is not None and i in written:
+                value = written[i]
+            values[name] = value
+        values.setdefault("hs_object_id", str(FIRST_ID + i))
+        return values
+
+    def object(self, object_type, i, names):
+        return {"id": str(FIRST_ID + i), "properties": self.properties(object_type, i, names)}
+
+    def write(self, object_type, object_id, props):
+        i = self.index(object_id)
+        if i is None:
+            return False
+        with self._lock:
+            for name, value in props.items():
+                self._written.setdefault((object_type, name), {})[i] = sys.intern(str(value))
+        return True
+
+    def key_range(self, filters):
+        """Index range [lo, hi) matching hs_object_id / last-modified filters (both grow with the index)"""
+        lo, hi = 0, self.records
+        for f in filters:
+            name, op = f.get("propertyName"), f.get("operator")
+            if name == "hs_object_id":
+                offset, scale = FIRST_ID, 1
+            elif name in _DATE_PROPERTIES:
+                offset, scale = FIRST_MODIFIED_MS, MODIFIED_STEP_MS
+            else:
+                continue
+            value = _millis(f.get("value")) - offset
+            first_ge = -(-value // scale)  # first index with key >= value
+            first_gt = value // scale + 1  # first index with key > value
+            if op == "GTE":
+                lo = max(lo, first_ge)
+            elif op == "GT":
+                lo = max(lo, first_gt)
+            elif op == "LT":
+                hi = min(hi, first_ge)
+            elif op == "LTE":
+                hi = min(hi, first_gt)
+            elif op == "EQ":
+                lo, hi = max(lo, first_ge), min(hi, first_gt)
+        return max(0, lo), max(0, min(hi, self.records))
+
+
+class Upstream:
+    """Fault settings and call counts for one stand-in API"""
+
+    def __init__(self, name, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit=0.0,
+                 item_latency_ms=0.0, max_items=0, reject_rate=0.0, auth_fail_after=None):
+        self.name = name
+        self.reject_rate = reject_rate
+        self.auth_fail_after = auth_fail_after
+        self.latency_ms = latency_ms
+        self.item_latency_ms = item_latency_ms
+        self.max_items = max_items
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (second, requests in it)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.items = {}
+            self.errors = 0
+            self.throttled = 0
+
+    def admit(self, operation, items=0):
+        """Count a call and decide its fate: None to serve it, or an error status to return"""
+        with self._lock:
+            # The API key stops working once auth_fail_after calls have been served
+            if self.auth_fail_after is not None and sum(self.calls.values()) >= self.auth_fail_after:
+                self.calls[operation] = self.calls.get(operation, 0) + 1
+                self.errors += 1
+                return 401
+        if self.max_items and items > self.max_items:
+            with self._lock:
+                self.calls[operation] = self.calls.get(operation, 0) + 1
+                self.errors += 1
+            return 413
+        delay = self.latency_ms + items * self.item_latency_ms
+        delay += random.random() * self.jitter_ms if self.jitter_ms else 0.0
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            second = int(time.time())
+            start, count = self._window
+            count = count + 1 if start == second else 1
+            self._window = (second, count)
+            if self.rate_limit and count > self.rate_limit:
+                self.throttled += 1
+                return 429
+            if self.error_rate and random.random() < self.error_rate:
+                self.errors += 1
+                return 503
+        return None
+
+    def rejected(self, items):
+        """Those of items refused whenever they are sent (a fixed share, reject_rate); an error if any"""
+        if not self.reject_rate:
+            return []
+        limit = self.reject_rate * 1_000_000
+        bad = [item for item in items if zlib.crc32(str(item).encode()) % 1_000_000 < limit]
+        if bad:
+            with self._lock:
+                self.errors += 1
+        return bad
+
+    def count_items(self, operation, n):
+        with self._lock:
+            self.items[operation] = self.items.get(operation, 0) + n
+
+    def remaining(self):
+        start, count = self._window
+        return max(0, int(self.rate_limit) - count) if start == int(time.time()) else int(self.rate_limit)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "items": dict(self.items),
+                "errors": self.errors,
+                "throttled": self.throttled,
+            }
+
+
+def _tps_listed(number):
+    digits = re.sub(r"\D", "", str(number))
+    return (sum(map(int, digits)) % 10) < 3 if digits else False
+
+
+class MockAPIs:
+    """The stand-in server; start() runs it on a background thread"""
+
+    def __init__(self, portal, hubspot=None, tps=None, host="127.0.0.1", port=0):
+        self.portal = portal
+        self.hubspot = hubspot or Upstream("hubspot")
+        self.tps = tps or Upstream("tps")
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="mock-apis", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        return {"records": self.portal.records, "hubspot": self.hubspot.stats(), "tps": self.tps.stats()}
+
+    def _handler(self):
+        apis = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; don't let Nagle hold the body back
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, str(value))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _refuse(self, upstream, status):
+                headers = {"Retry-After": 1} if status == 429 else {}
+                if upstream is apis.hubspot and upstream.rate_limit:
+                    headers.update({
+                        "X-HubSpot-RateLimit-Interval-Milliseconds": 1000,
+                        "X-HubSpot-RateLimit-Max": int(upstream.rate_limit),
+                        "X-HubSpot-RateLimit-Remaining": upstream.remaining(),
+                    })
+                message = {429: "rate limit exceeded", 413: "too many numbers", 401: "invalid API key"}.get(status, "injected error")
+                self._send(status, {"status": "error", "message": message}, headers)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/_stats":
+                    return self._send(200, apis.stats())
+                match = _OBJECT_PATH.match(url.path)
+                if not match or match.group(2):
+                    return self._send(404, {"message": "not found"})
+                status = apis.hubspot.admit("list")
+                if status:
+                    return self._refuse(apis.hubspot, status)
+                query = parse_qs(url.query)
+                names = [p for v in query.get("properties", []) for p in v.split(",") if p]
+                limit = min(100, int(query.get("limit", ["10"])[0]))
+                after = int(query.get("after", ["0"])[0] or 0)
+                end = min(after + limit, apis.portal.records)
+                results = [apis.portal.object(match.group(1), i, names) for i in range(after, end)]
+                apis.hubspot.count_items("list", len(results))
+                body = {"results": results}
+                if end < apis.portal.records:
+                    link = f"{apis.base_url}{url.path}?limit={limit}&after={end}"
+                    body["paging"] = {"next": {"after": str(end), "link": link}}
+                self._send(200, body)
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path == "/_reset":
+                    apis.hubspot.reset()
+                    apis.tps.reset()
+                    return self._send(200, {"reset": True})
+                body = self._body()
+                match = _OBJECT_PATH.match(url.path)
+                if not match:
+                    return self._check_tps(body)
+                object_type, action = match.group(1), match.group(2)
+                operation = {"/batch/read": "batch_read", "/batch/update": "batch_update", "/search": "search"}.get(action)
+                if operation is None:
+                    return self._send(404, {"message": "not found"})
+                status = apis.hubspot.admit(operation)
+                if status:
+                    return self._refuse(apis.hubspot, status)
+                if operation == "batch_read":
+                    names = body.get("properties") or []
+                    found = [apis.portal.index(item.get("id")) for item in body.get("inputs", [])]
+                    results = [apis.portal.object(object_type, i, names) for i in found if i is not None]
+                    apis.hubspot.count_items(operation, len(results))
+                    return self._send(200, {"status": "COMPLETE", "results": results})
+                if operation == "batch_update":
+                    inputs = body.get("inputs", [])
+                    results = [
+                        {"id": str(item.get("id")), "properties": item.get("properties", {})}
+                        for item in inputs
+                        if apis.portal.write(object_type, item.get("id"), item.get("properties", {}))
+                    ]
+                    apis.hubspot.count_items(operation, len(results))
+                    return self._send(200, {"status": "COMPLETE", "results": results})
+                return self._search(object_type, body)
+
+            def _search(self, object_type, body):
+                filters = [f for group in body.get("filterGroups", [])[:1] for f in group.get("filters", [])]
+                lo, hi = apis.portal.key_range(filters)
+                limit = min(200, int(body.get("limit") or 10))
+                after = int(body.get("after") or 0)
+                if after + limit > SEARCH_RESULT_CAP:
+                    return self._send(400, {"status": "error", "message": "search results are capped at 10,000"})
+                descending = any(s.get("direction") == "DESCENDING" for s in body.get("sorts", [])[:1])
+                total = max(0, hi - lo)
+                if descending:
+                    indexes = range(hi - 1 - after, max(lo, hi - after - limit) - 1, -1)
+                else:
+                    indexes = range(lo + after, min(hi, lo + after + limit))
+                names = body.get("properties") or []
+                results = [apis.portal.object(object_type, i, names) for i in indexes]
+                apis.hubspot.count_items("search", len(results))
+                response = {"total": total, "results": results}
+                if after + limit < total:
+                    response["paging"] = {"next": {"after": str(after + limit)}}
+                self._send(200, response)
+
+            def _check_tps(self, body):
+                numbers = body.get("phone_numbers") or []
+                status = apis.tps.admit("check", len(numbers))
+                if status:
+                    return self._refuse(apis.tps, status)
+                rejected = apis.tps.rejected(numbers)
+                if rejected:
+                    return self._send(400, {"status": "error", "message": f"invalid phone number: {rejected[0]}"})
+                apis.tps.count_items("check", len(numbers))
+                results = [{"phone_number": n, "on_tps": _tps_listed(n), "on_ctps": False} for n in numbers]
+                self._send(200, {"results": results})
+
+        return Handler
+
+
+def webhook_bursts(portal, bursts, size, object_type="company", phone_share=0.8, seed=0):
+    """
+    Yield bursts lists of size HubSpot webhook events for random records:
+    mostly phone property changes (carrying the new number) and some creations.
+    """
+    rng = random.Random(seed)
+    event_id = 1
+    for _ in range(int(bursts)):
+        burst = []
+        for _ in range(int(size)):
+            i = rng.randrange(portal.records)
+            event = {
+                "eventId": event_id,
+                "subscriptionId": 1,
+                "portalId": 1,
+                "occurredAt": int(time.time() * 1000),
+                "objectId": FIRST_ID + i,
+                "attemptNumber": 0,
+            }
+            if rng.random() < phone_share:
+                event.update(subscriptionType=f"{object_type}.propertyChange", propertyName="phone",
+                             propertyValue=portal.properties(object_type, i, ["phone"])["phone"])
+            else:
+                event["subscriptionType"] = f"{object_type}.creation"
+            burst.append(event)
+            event_id += 1
+        yield burst
+
+
+def add_arguments(parser):
+    """Mock server options, shared with benchmark.py"""
+    parser.add_argument("--records", type=int, default=10_000, help="records per object type")
+    parser.add_argument("--unique-numbers", type=int, default=None, help="distinct phone numbers (default: one per record)")
+    for name in ("hubspot", "tps"):
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=0.0)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=0.0)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0, help="share of calls answered 503")
+        parser.add_argument(f"--{name}-rate-limit", type=float, default=0.0, help="requests/s before 429 (0: unlimited)")
+    parser.add_argument("--tps-item-latency-ms", type=float, default=0.0, help="extra TPS latency per number checked")
+    parser.add_argument("--tps-max-batch", type=int, default=0, help="numbers per TPS request before 413 (0: unlimited)")
+    parser.add_argument("--tps-reject-rate", type=float, default=0.0,
+                        help="share of numbers TPS refuses with a 400 for the whole request")
+    parser.add_argument("--tps-auth-fail-after", type=int, default=None,
+                        help="answer 401 to every TPS call after this many (default: never)")
+
+
+def from_args(args, port=0):
+    def upstream(name):
+        return Upstream(
+            name,
+            latency_ms=getattr(args, f"{name}_latency_ms"),
+            jitter_ms=getattr(args, f"{name}_jitter_ms"),
+            error_rate=getattr(args, f"{name}_error_rate"),
+            rate_limit=getattr(args, f"{name}_rate_limit"),
+            item_latency_ms=getattr(args, f"{name}_item_latency_ms", 0.0),
+            max_items=getattr(args, f"{name}_max_batch", 0),
+            reject_rate=getattr(args, f"{name}_reject_rate", 0.0),
+            auth_fail_after=getattr(args, f"{name}_auth_fail_after", None),
+        )
+    return MockAPIs(Portal(args.records, args.unique_numbers), upstream("hubspot"), upstream("tps"), port=port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run local TPS and HubSpot stand-ins")
+    parser.add_argument("--port", type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    apis = from_args(args, port=args.port)
+    print(apis.base_url, flush=True)
+    try:
+        apis.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
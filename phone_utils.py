@@ -0,0 +1,82 @@
+"""
+UK phone number normalization and de-duplication.
+
+TPS only covers UK numbers, and HubSpot stores them however they were typed
+("+44 20 7946 0000", "020 7946 0000", "02079460000", ...). Everything is
+converted to one canonical national form (leading 0, digits only) before it
+is sent to TPS, cached or compared, so the same number is only checked once.
+"""
+
+import re
+
+_EXTENSION = re.compile(r"(?:ext\.?|extension|x|#)\s*\d+\s*$", re.IGNORECASE)
+_TRUNK_IN_BRACKETS = re.compile(r"\(\s*0\s*\)")
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_uk_phone(raw):
+    """
+    Return the canonical national form of a UK number (e.g. "02079460000"),
+    or None if it isn't a plausible UK number.
+    """
+    if not raw or not isinstance(raw, str):
+        return None
+    s = raw.strip()
+    if not s:
+        return None
+
+    s = _EXTENSION.sub("", s)
+    s = _TRUNK_IN_BRACKETS.sub("", s)  # "+44 (0)20 ..." -> "+44 20 ..."
+    international = s.startswith("+")
+    digits = _NON_DIGITS.sub("", s)
+    if not digits:
+        return None
+
+    if international:
+        if not digits.startswith("44"):
+            return None  # Non-UK number - TPS doesn't cover it
+        national = digits[2:]
+    elif digits.startswith("0044"):
+        national = digits[4:]
+    elif digits.startswith("00"):
+        return None  # International dialling prefix for another country
+    elif digits.startswith("44") and len(digits) in (11, 12):
+        national = digits[2:]
+    elif digits.startswith("0"):
+        national = digits[1:]
+    else:
+        # Leading zero lost (e.g. a spreadsheet stored it as a number)
+        national = digits
+
+    national = national.lstrip("0")
+    if len(national) not in (9, 10):
+        return None
+    if national[0] not in "1235789":
+        return None  # 04 and 06 are unallocated ranges
+    return "0" + national
+
+
+def build_batch(entries):
+    """
+    Normalize and de-duplicate (number_type, object_id, raw_phone) entries.
+
+    Returns (numbers, mapping, invalid) where numbers is a list of unique
+    canonical numbers, mapping[idx] lists every (number_type, object_id)
+    sharing numbers[idx], and invalid lists the entries that were rejected.
+    """
+    numbers = []
+    mapping = []
+    index = {}
+    invalid = []
+    for number_type, object_id, raw in entries:
+        number = normalize_uk_phone(raw)
+        if not number:
+            invalid.append((number_type, object_id, raw))
+            continue
+        idx = index.get(number)
+        if idx is None:
+            idx = index[number] = len(numbers)
+            numbers.append(number)
+            mapping.append([])
+        mapping[idx].append((number_type, object_id))
+    return numbers, mapping, invalid
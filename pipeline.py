@@ -0,0 +1,192 @@
+"""
+Streaming pipeline helpers for the batch workflows.
+
+The batch scripts used to page the whole CRM into a list before checking
+anything. These helpers let each stage run as a generator instead: prefetch
+runs a producer (e.g. HubSpot paging) on a background thread behind a bounded
+queue, merge does the same for several producers at once, batched groups a
+stream into TPS-sized lists, map_batched fans one list out as concurrent
+sub-batches, and Sink runs the result writer on its own thread. Fetching, checking and writing then overlap while memory stays
+bounded by the queue sizes, however large the portal is.
+"""
+
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(iterable, maxsize=4, name="prefetch"):
+    """Iterate iterable on a background thread, buffering at most maxsize items"""
+    yield from merge([iterable], workers=1, maxsize=maxsize, name=name)
+
+
+def merge(iterables, workers=4, maxsize=4, name="merge"):
+    """
+    Iterate several iterables concurrently (at most workers at a time) and
+    yield their items as they arrive, buffering at most maxsize items.
+    """
+    iterables = list(iterables)
+    buffer = queue.Queue(maxsize=max(1, int(maxsize)))
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(iterable):
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_Failure(e))
+            return
+        put(_DONE)
+
+    pending = queue.SimpleQueue()
+    for iterable in iterables:
+        pending.put(iterable)
+
+    def run():
+        while not stop.is_set():
+            try:
+                iterable = pending.get_nowait()
+            except queue.Empty:
+                return
+            produce(iterable)
+
+    # Daemon threads, so a consumer that stops early never blocks interpreter exit
+    for i in range(min(max(1, int(workers)), len(iterables))):
+        threading.Thread(target=run, name=f"{name}-{i}", daemon=True).start()
+    remaining = len(iterables)
+    try:
+        while remaining:
+            item = buffer.get()
+            if item is _DONE:
+                remaining -= 1
+                continue
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def map_batched(fn, items, size, workers=4, name="map", on_chunk=None):
+    """
+    Call fn(chunk) on consecutive chunks of at most size items, with up to
+    workers chunks in flight at once, and return the results concatenated in
+    item order. Each chunk's results are padded or trimmed to its length so
+    they stay aligned with items. size may be a function returning the next
+    chunk's size (e.g. an adaptive sizer); chunks are then cut as they are sent.
+    on_chunk(chunk, results) is called as each chunk finishes, so its results
+    can be kept even if a sibling chunk fails and map_batched raises.
+    """
+    items = list(items)
+    if on_chunk:
+        fn = partial(_call_chunk, fn, on_chunk)
+    if callable(size):
+        chunks, parts = _map_sized(fn, items, size, max(1, int(workers)), name)
+    else:
+        size = max(1, int(size))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        workers = max(1, min(int(workers), len(chunks)))
+        if workers == 1:
+            parts = [fn(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) as executor:
+                parts = list(executor.map(fn, chunks))
+    results = []
+    for chunk, part in zip(chunks, parts):
+        part = list(part or [])[:len(chunk)]
+        results.extend(part + [None] * (len(chunk) - len(part)))
+    return results
+
+
+def _call_chunk(fn, on_chunk, chunk):
+    part = list(fn(chunk) or [])[:len(chunk)]
+    part += [None] * (len(chunk) - len(part))
+    on_chunk(chunk, part)
+    return part
+
+
+def _map_sized(fn, items, next_size, workers, name):
+    """map_batched with each chunk's size asked for only when a worker is free to send it"""
+    chunks, futures = [], []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) as executor:
+        running = set()
+        pos = 0
+        while pos < len(items):
+            if len(running) >= workers:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()  # Stop early on a failure
+            chunk = items[pos:pos + max(1, int(next_size()))]
+            pos += len(chunk)
+            future = executor.submit(fn, chunk)
+            running.add(future)
+            chunks.append(chunk)
+            futures.append(future)
+        parts = [future.result() for future in futures]
+    return chunks, parts
+
+
+class Sink:
+    """Runs fn(item) for each put item on a background thread, with a bounded backlog"""
+
+    def __init__(self, fn, maxsize=4, name="sink"):
+        self.fn = fn
+        self._queue = queue.Queue(maxsize=max(1, int(maxsize)))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        """Hand an item to the sink (blocks while the backlog is full)"""
+        if self._error:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        """Wait for everything put so far to be handled; re-raises a sink failure"""
+        self._queue.put(_DONE)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if self._error:
+                continue  # Keep draining so producers never block on a dead sink
+            try:
+                self.fn(item)
+            except Exception as e:
+                self._error = e
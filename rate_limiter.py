@@ -0,0 +1,220 @@
+"""
+Adaptive token-bucket rate limiting for HubSpot and TPS calls.
+
+Each upstream has one bucket. By default the bucket state lives in a small
+SQLite file so every thread and process on the machine (gunicorn workers,
+batch scripts running side by side) draws from the same budget; with no state
+file it falls back to an in-process bucket.
+
+Callers reserve a token before each request and sleep off any deficit, so
+waiters are served roughly in arrival order. The refill rate adapts
+(additive increase, multiplicative decrease): it is cut on 429 responses or
+when HubSpot's rate-limit headers say the window is nearly used up, and
+creeps back up towards the configured ceiling while responses are healthy.
+
+Shards of a batch run on one machine share the buckets like any other
+processes. Shards on separate machines can't, so each can instead be given a
+fixed share of every rate (set_share) in a bucket of its own.
+"""
+
+import os
+import threading
+import time
+
+import state_backend
+
+MIN_RATE = 0.1
+INCREASE_FRACTION = 0.05
+LOW_REMAINING_FRACTION = 0.1
+
+
+class TokenBucket:
+    """Token bucket whose state can be shared across processes via SQLite"""
+
+    def __init__(self, name, rate, burst=None, path=None):
+        self.name = name
+        self.max_rate = max(MIN_RATE, float(rate))
+        self.burst = max(1.0, float(burst if burst is not None else rate))
+        self.path = str(path) if path else None
+        self.waited = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+        # In-process state (used when there is no state file)
+        self._tokens = self.burst
+        self._rate = self.max_rate
+        self._updated = time.monotonic()
+        if self.path:
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " rate REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, rate, updated) VALUES (?, ?, ?, ?)",
+                (self.name, self.burst, self.max_rate, time.time()),
+            )
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=True)
+
+    def _update(self, fn):
+        """Apply fn(tokens, rate, elapsed) -> (tokens, rate, result) atomically"""
+        if not self.path:
+            with self._lock:
+                now = time.monotonic()
+                rate = min(self._rate, self.max_rate)
+                tokens, rate, result = fn(self._tokens, rate, now - self._updated)
+                self._tokens, self._rate, self._updated = tokens, rate, now
+                return result
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            tokens, rate, updated = conn.execute(
+                "SELECT tokens, rate, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            # The configured ceiling may have been lowered since the row was written
+            rate = min(rate, self.max_rate)
+            tokens, rate, result = fn(tokens, rate, max(0.0, now - updated))
+            conn.execute(
+                "UPDATE buckets SET tokens = ?, rate = ?, updated = ? WHERE name = ?",
+                (tokens, rate, now, self.name),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    # --- consumers ---
+    def acquire(self, tokens=1):
+        """Reserve tokens, sleeping until they are available; returns seconds waited"""
+        def reserve(current, rate, elapsed):
+            current = min(self.burst, current + elapsed * rate) - tokens
+            wait = -current / rate if current < 0 else 0.0
+            return current, rate, wait
+
+        wait = self._update(reserve)
+        if wait > 0:
+            with self._lock:
+                self.waited += wait
+            time.sleep(wait)
+        return wait
+
+    # --- feedback ---
+    def observe(self, response):
+        """Adapt the refill rate to a response's status and rate-limit headers"""
+        if response is None:
+            return
+        headers = response.headers
+        ceiling = self.max_rate
+        pressure = None
+
+        interval_ms = _header_float(headers, "X-HubSpot-RateLimit-Interval-Milliseconds")
+        window_max = _header_float(headers, "X-HubSpot-RateLimit-Max")
+        remaining = _header_float(headers, "X-HubSpot-RateLimit-Remaining")
+        if interval_ms and window_max:
+            interval = interval_ms / 1000.0
+            ceiling = min(ceiling, window_max / interval)
+            if remaining is not None and remaining < window_max * LOW_REMAINING_FRACTION:
+                # Nearly out of this window - spread what's left over it
+                pressure = max(MIN_RATE, remaining / interval)
+
+        if response.status_code == 429:
+            retry_after = _header_float(headers, "Retry-After")
+
+            def back_off(tokens, rate, elapsed):
+                rate = max(MIN_RATE, min(rate, ceiling) / 2)
+                # Drain the bucket so nobody sends until Retry-After has passed
+                tokens = -(retry_after or 1.0) * rate
+                return tokens, rate, rate
+
+            with self._lock:
+                self.throttled += 1
+            self._update(back_off)
+            return
+
+        def adjust(tokens, rate, elapsed):
+            tokens = min(self.burst, tokens + elapsed * rate)
+            if pressure is not None:
+                rate = min(rate, pressure)
+            else:
+                rate = min(ceiling, rate + ceiling * INCREASE_FRACTION)
+            return tokens, max(MIN_RATE, rate), rate
+
+        self._update(adjust)
+
+    def stats(self):
+        def read(tokens, rate, elapsed):
+            return tokens, rate, (min(self.burst, tokens + elapsed * rate), rate)
+
+        tokens, rate = self._update(read)
+        return {
+            "rate_per_sec": round(rate, 3),
+            "max_rate_per_sec": self.max_rate,
+            "tokens": round(tokens, 2),
+            "throttled": self.throttled,
+            "waited_seconds": round(self.waited, 2),
+        }
+
+
+def _header_float(headers, name):
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+# This process's share of each configured rate, and the suffix of its own buckets
+_share = {"fraction": 1.0, "key": ""}
+
+DEFAULT_RATES = {
+    "hubspot": "10",
+    # HubSpot's CRM search endpoints have their own, lower per-second limit
+    "hubspot_search": "4",
+    "tps": "5",
+}
+
+
+def set_share(fraction, key):
+    """
+    From now on, limit this process to fraction of each upstream's configured
+    rate, in buckets named after key instead of the shared ones (e.g. 1/N each
+    for N shards that don't share RATE_LIMIT_STATE_PATH)
+    """
+    with _limiters_lock:
+        _share.update(fraction=min(1.0, max(0.0, float(fraction))) or 1.0, key=str(key))
+        _limiters.clear()
+
+
+def get_limiter(upstream):
+    """Return the process-wide bucket for an upstream, configured from the environment"""
+    with _limiters_lock:
+        limiter = _limiters.get(upstream)
+        if limiter is None:
+            prefix = upstream.upper()
+            try:
+                rate = float(os.environ.get(f"{prefix}_RATE_PER_SEC", DEFAULT_RATES.get(upstream, "10")))
+            except ValueError:
+                rate = float(DEFAULT_RATES.get(upstream, "10"))
+            burst = os.environ.get(f"{prefix}_RATE_BURST")
+            try:
+                burst = float(burst) if burst else None
+            except ValueError:
+                burst = None
+            path = os.environ.get("RATE_LIMIT_STATE_PATH", "rate_limits.db")
+            name, fraction = upstream, _share["fraction"]
+            if _share["key"]:
+                name = f"{upstream}:{_share['key']}"
+                rate *= fraction
+                burst = max(1.0, burst * fraction) if burst else None
+            limiter = _limiters[upstream] = TokenBucket(name, rate, burst=burst, path=path or None)
+        return limiter
@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""
+Indexed store of TPS check results, replacing the append-only tps_results.csv.
+
+Results live in a SQLite database (WAL mode) with one row per
+(object type, object ID, number field) - e.g. ("contacts", "123", "mobile") -
+holding the normalized number, its status and when it was first and last
+checked. Re-checking a field overwrites its row, so lookups are a primary-key
+seek and "has this number already been checked?" never needs a full scan.
+
+A second table remembers the property values HubSpot is known to hold (from
+our own writes, reads and property-change webhooks), so write-back can skip
+updates that would change nothing.
+
+A third table holds quarantined numbers: ones TPS refused outright (see
+tps_jobs.post_tps_isolating), with the reason. They are skipped by later
+checks until released:
+
+    python result_store.py quarantine
+    python result_store.py quarantine --release    # check them again next run
+
+A sharded batch run (see sharding.py) writes to a partition of its own: a
+store opened with base=<the main store> also reads earlier results from the
+base, and merge() folds partitions back into the main store.
+
+The CSV format (id, field, number, status) is kept for import and export:
+
+    python result_store.py import contacts tps_results.csv
+    python result_store.py export contacts tps_results.csv
+    python result_store.py compact
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+
+import state_backend
+from phone_utils import normalize_uk_phone
+from pipeline import batched
+
+_LOOKUP_CHUNK = 500
+_PAGE = 5000
+
+
+class ResultStore:
+    """SQLite-backed latest TPS result per object number field"""
+
+    def __init__(self, path="tps_results.db", base=None):
+        self.path = str(path)
+        # Store this one is a partition of: lookups fall back to it, writes only go here
+        self.base = base
+        self.location = state_backend.get_backend().describe(self.path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tps_results ("
+                " object_type TEXT NOT NULL,"
+                " object_id TEXT NOT NULL,"
+                " field TEXT NOT NULL,"
+                " number TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " first_checked_at REAL NOT NULL,"
+                " checked_at REAL NOT NULL,"
+                " PRIMARY KEY (object_type, object_id, field)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tps_results_checked_at ON tps_results (checked_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hubspot_values ("
+                " object_type TEXT NOT NULL,"
+                " object_id TEXT NOT NULL,"
+                " property TEXT NOT NULL,"
+                " value TEXT,"
+                " synced_at REAL NOT NULL,"
+                " PRIMARY KEY (object_type, object_id, property)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tps_quarantine ("
+                " number TEXT PRIMARY KEY,"
+                " reason TEXT NOT NULL,"
+                " quarantined_at REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.environ.get("RESULT_STORE_PATH", "tps_results.db"))
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=False)
+
+    # --- writes ---
+    def record_many(self, object_type, rows, checked_at=None):
+        """Store (object_id, field, number, status) rows, replacing earlier results for those fields"""
+        now = time.time() if checked_at is None else checked_at
+        values = [
+            (object_type, str(object_id), field, normalize_uk_phone(number) or number, status, now, now)
+            for object_id, field, number, status in rows
+        ]
+        if not values:
+            return 0
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO tps_results"
+                " (object_type, object_id, field, number, status, first_checked_at, checked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (object_type, object_id, field) DO UPDATE SET"
+                " number = excluded.number, status = excluded.status, checked_at = excluded.checked_at",
+                values,
+            )
+        return len(values)
+
+    # --- reads ---
+    def lookup_many(self, object_type, object_ids):
+        """Return {(object_id, field): (number, status)} for the given objects"""
+        ids = list(dict.fromkeys(str(i) for i in object_ids))
+        found = self.base.lookup_many(object_type, ids) if self.base else {}
+        conn = self._conn()
+        for i in range(0, len(ids), _LOOKUP_CHUNK):
+            chunk = ids[i:i + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT object_id, field, number, status FROM tps_results"
+                f" WHERE object_type = ? AND object_id IN ({marks})",
+                (object_type, *chunk),
+            ).fetchall()
+            for object_id, field, number, status in rows:
+                found[(object_id, field)] = (number, status)
+        return found
+
+    # --- values known to be in HubSpot ---
+    def record_synced(self, object_type, values):
+        """Remember {object_id: {property: value}} as what HubSpot currently holds"""
+        now = time.time()
+        rows = [
+            (object_type, str(object_id), prop, None if value is None else str(value), now)
+            for object_id, props in values.items()
+            for prop, value in props.items()
+        ]
+        if not rows:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO hubspot_values (object_type, object_id, property, value, synced_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def synced_values(self, object_type, object_ids, max_age=None):
+        """Return {object_id: {property: value}} known to be in HubSpot (no older than max_age seconds)"""
+        ids = list(dict.fromkeys(str(i) for i in object_ids))
+        cutoff = time.time() - max_age if max_age else 0
+        found = {}
+        conn = self._conn()
+        for i in range(0, len(ids), _LOOKUP_CHUNK):
+            chunk = ids[i:i + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                "SELECT object_id, property, value FROM hubspot_values"
+                f" WHERE object_type = ? AND object_id IN ({marks}) AND synced_at >= ?",
+                (object_type, *chunk, cutoff),
+            ).fetchall()
+            for object_id, prop, value in rows:
+                found.setdefault(object_id, {})[prop] = value
+        return found
+
+    # --- numbers TPS refuses ---
+    def quarantine_many(self, reasons):
+        """Quarantine {number: reason}, so the numbers are skipped until released"""
+        now = time.time()
+        rows = [(normalize_uk_phone(number) or number, str(reason)[:500], now) for number, reason in reasons.items()]
+        if not rows:
+            return 0
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tps_quarantine (number, reason, quarantined_at) VALUES (?, ?, ?)", rows,
+            )
+        return len(rows)
+
+    def quarantined(self, numbers):
+        """Return {number: reason} for those of the (normalized) numbers that are quarantined"""
+        numbers = list(dict.fromkeys(numbers))
+        found = self.base.quarantined(numbers) if self.base else {}
+        conn = self._conn()
+        for i in range(0, len(numbers), _LOOKUP_CHUNK):
+            chunk = numbers[i:i + _LOOKUP_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT number, reason FROM tps_quarantine WHERE number IN ({marks})", chunk,
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def iter_quarantine(self):
+        """Yield (number, reason, quarantined_at), oldest first"""
+        yield from self._conn().execute(
+            "SELECT number, reason, quarantined_at FROM tps_quarantine ORDER BY quarantined_at, number"
+        )
+
+    def release_quarantine(self, numbers=None):
+        """Release the given numbers (all of them if None) to be checked again; returns how many"""
+        with self._conn() as conn:
+            if numbers is None:
+                return conn.execute("DELETE FROM tps_quarantine").rowcount
+            rows = [(normalize_uk_phone(n) or n,) for n in numbers]
+            return conn.executemany("DELETE FROM tps_quarantine WHERE number = ?", rows).rowcount
+
+    def iter_results(self, object_type=None):
+        """
+        Yield (object_type, object_id, field, number, status, checked_at) rows
+        in key order, a page at a time: a cursor left open while the caller
+        writes to the store (sync records what it wrote) would pin a stale
+        snapshot, and SQLite fails that write at once if another process
+        (a sync shard) has written since
+        """
+        sql = "SELECT object_type, object_id, field, number, status, checked_at FROM tps_results WHERE 1"
+        params = ()
+        if object_type:
+            sql += " AND object_type = ?"
+            params = (object_type,)
+        last = None
+        while True:
+            after = " AND (object_type, object_id, field) > (?, ?, ?)" if last else ""
+            rows = self._conn().execute(
+                sql + after + " ORDER BY object_type, object_id, field LIMIT ?", (*params, *(last or ()), _PAGE),
+            ).fetchall()
+            yield from rows
+            if len(rows) < _PAGE:
+                return
+            last = rows[-1][:3]
+
+    def count(self, object_type=None):
+        if object_type:
+            row = self._conn().execute("SELECT COUNT(*) FROM tps_results WHERE object_type = ?", (object_type,))
+        else:
+            row = self._conn().execute("SELECT COUNT(*) FROM tps_results")
+        return row.fetchone()[0]
+
+    # --- CSV and maintenance ---
+    def import_csv(self, object_type, csv_path):
+        """Load an id,field,number,status CSV; later rows win over earlier ones"""
+        latest = {}
+        with open(csv_path, "r", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) < 4 or not row[0].strip() or not row[3].strip():
+                    continue
+                latest[(row[0].strip(), row[1].strip().lower())] = (row[2].strip(), row[3].strip())
+        rows = [(object_id, field, number, status) for (object_id, field), (number, status) in latest.items()]
+        return self.record_many(object_type, rows)
+
+    def export_csv(self, object_type, csv_path):
+        """Write the store back out in the id,field,number,status CSV format"""
+        written = 0
+        with open(csv_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for _, object_id, field, number, status, _ in self.iter_results(object_type):
+                writer.writerow([object_id, field, number, status])
+                written += 1
+        return written
+
+    def merge(self, path):
+        """
+        Fold another store (a shard's partition) into this one: results,
+        known HubSpot values and quarantined numbers, keeping whichever side is
+        newer. Safe to repeat; returns the number of results taken from it.
+        """
+        location = state_backend.get_backend().location(path)
+        if not os.path.exists(location):
+            raise FileNotFoundError(f"No result store at {location}")
+        ResultStore(path)  # a partition that never saved anything may lack tables
+        conn = self._conn()
+        conn.execute("ATTACH DATABASE ? AS part", (location,))
+        try:
+            with conn:
+                # "WHERE true" keeps SQLite from reading ON CONFLICT as part of the SELECT
+                merged = conn.execute(
+                    "INSERT INTO tps_results"
+                    " (object_type, object_id, field, number, status, first_checked_at, checked_at)"
+                    " SELECT object_type, object_id, field, number, status, first_checked_at, checked_at"
+                    " FROM part.tps_results WHERE true"
+                    " ON CONFLICT (object_type, object_id, field) DO UPDATE SET"
+                    " number = excluded.number, status = excluded.status, checked_at = excluded.checked_at,"
+                    " first_checked_at = MIN(tps_results.first_checked_at, excluded.first_checked_at)"
+                    " WHERE excluded.checked_at > tps_results.checked_at"
+                ).rowcount
+                conn.execute(
+                    "INSERT INTO hubspot_values (object_type, object_id, property, value, synced_at)"
+                    " SELECT object_type, object_id, property, value, synced_at FROM part.hubspot_values WHERE true"
+                    " ON CONFLICT (object_type, object_id, property) DO UPDATE SET"
+                    " value = excluded.value, synced_at = excluded.synced_at"
+                    " WHERE excluded.synced_at > hubspot_values.synced_at"
+                )
+                conn.execute(
+                    "INSERT INTO tps_quarantine (number, reason, quarantined_at)"
+                    " SELECT number, reason, quarantined_at FROM part.tps_quarantine WHERE true"
+                    " ON CONFLICT (number) DO UPDATE SET"
+                    " reason = excluded.reason, quarantined_at = excluded.quarantined_at"
+                    " WHERE excluded.quarantined_at > tps_quarantine.quarantined_at"
+                )
+        finally:
+            conn.execute("DETACH DATABASE part")
+        return merged
+
+    def compact(self, older_than_days=None):
+        """Optionally drop results not re-checked for older_than_days, then reclaim space"""
+        removed = 0
+        conn = self._conn()
+        if older_than_days is not None:
+            with conn:
+                cutoff = time.time() - float(older_than_days) * 86400
+                removed = conn.execute("DELETE FROM tps_results WHERE checked_at < ?", (cutoff,)).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+        return removed
+
+
+def iter_unchecked(store, object_type, records, fields, chunk=_LOOKUP_CHUNK):
+    """
+    Yield each record (a dict with "id" and the given number fields) with any
+    field that needs no TPS check set to None: its number matches the number
+    last checked for it, isn't a valid UK number or is quarantined. Records
+    are looked up in chunks, so this is two indexed queries per chunk.
+    """
+    for batch in batched(records, chunk):
+        checked = store.lookup_many(object_type, [r["id"] for r in batch])
+        to_check = []  # (record, field, number)
+        for record in batch:
+            for field in fields:
+                raw = record.get(field)
+                number = normalize_uk_phone(raw) if raw else None
+                previous = checked.get((str(record["id"]), field))
+                if not number or (previous and previous[0] == number):
+                    record[field] = None
+                else:
+                    to_check.append((record, field, number))
+        held = store.quarantined([number for _, _, number in to_check]) if to_check else {}
+        for record, field, number in to_check:
+            if number in held:
+                record[field] = None
+        yield from batch
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the TPS result store")
+    parser.add_argument("--db", default=os.environ.get("RESULT_STORE_PATH", "tps_results.db"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("import", "export"):
+        p = sub.add_parser(name, help=f"{name} results in the tps_results.csv format")
+        p.add_argument("object_type", help="HubSpot object type, e.g. contacts or companies")
+        p.add_argument("csv_path", nargs="?", default="tps_results.csv")
+    p = sub.add_parser("compact", help="reclaim space, optionally dropping stale results")
+    p.add_argument("--older-than-days", type=float, default=None)
+    p = sub.add_parser("quarantine", help="list numbers TPS refused, or release them to be checked again")
+    p.add_argument("--release", nargs="*", metavar="NUMBER", default=None,
+                   help="release these numbers (all of them if none are given)")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.db)
+    if args.command == "import":
+        print(f"✓ Imported {store.import_csv(args.object_type, args.csv_path)} results from {args.csv_path}")
+    elif args.command == "export":
+        print(f"✓ Exported {store.export_csv(args.object_type, args.csv_path)} results to {args.csv_path}")
+    elif args.command == "quarantine":
+        if args.release is not None:
+            released = store.release_quarantine(args.release or None)
+            print(f"✓ Released {released} quarantined numbers - they will be checked on the next run")
+        else:
+            count = 0
+            for number, reason, quarantined_at in store.iter_quarantine():
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(quarantined_at))
+                print(f"{number}\t{when}\t{reason}")
+                count += 1
+            print(f"{count} quarantined numbers")
+    else:
+        print(f"✓ Compacted {args.db} ({store.compact(args.older_than_days)} stale results removed)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
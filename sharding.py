@@ -0,0 +1,67 @@
+"""
+Deterministic sharding of the batch jobs across processes or machines.
+
+`tps_cli.py check|backfill|sync --shard i/N` handles only the objects whose ID
+hashes to shard i of N (CRC32 of the ID, so every process and machine agrees
+without coordinating). Each shard keeps its own checkpoint, delta watermark and
+output partition - a result store file of its own next to RESULT_STORE_PATH,
+e.g. tps_results.shard-2-of-4.db - so shards can be started, stopped and
+resumed independently. `tps_cli.py merge` folds the partitions into the result
+store once they have finished (or after copying them back from other machines).
+"""
+
+import zlib
+from pathlib import Path
+
+
+class Shard:
+    """Shard index of count (1-based, as written on the command line: 1/4 ... 4/4)"""
+
+    def __init__(self, index, count):
+        index, count = int(index), int(count)
+        if count < 1 or not 1 <= index <= count:
+            raise ValueError(f"Invalid shard {index}/{count} (expected i/N with 1 <= i <= N)")
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def parse(cls, text):
+        """Shard from "i/N" (None for an empty value or "1/1", which is the whole portal)"""
+        if isinstance(text, Shard):
+            return text
+        text = (text or "").strip()
+        if not text:
+            return None
+        index, sep, count = text.partition("/")
+        try:
+            shard = cls(index, count) if sep else None
+        except ValueError:
+            shard = None
+        if shard is None:
+            raise ValueError(f"Invalid shard {text!r} (expected i/N, e.g. 1/4)")
+        return shard if shard.count > 1 else None
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def __repr__(self):
+        return f"Shard({self.index}, {self.count})"
+
+    def owns(self, object_id):
+        return shard_of(object_id, self.count) == self.index
+
+    def path(self, base):
+        """This shard's own copy of a state file: checkpoint.json -> checkpoint.shard-2-of-4.json"""
+        base = Path(base)
+        return str(base.with_name(f"{base.stem}.shard-{self.index}-of-{self.count}{base.suffix}"))
+
+
+def shard_of(object_id, count):
+    """The 1-based shard of count that owns object_id"""
+    return zlib.crc32(str(object_id).encode()) % int(count) + 1
+
+
+def partition_paths(base):
+    """Shard partitions written next to base (any shard count), in name order"""
+    base = Path(base)
+    return sorted(str(p) for p in base.parent.glob(f"{base.stem}.shard-*-of-*{base.suffix}"))
@@ -0,0 +1,143 @@
+"""
+Durable job queue shared by every gunicorn worker.
+
+Items are JSON rows in a state backend store (see state_backend.py) with the
+time they become due. Any process can put an item; worker processes claim due
+items in small batches, so whichever worker has free threads picks up the
+next event, and a delivery accepted by one worker can be processed by
+another. A claimed row stays in the table until it is acked; claims older than
+claim_timeout (a worker killed mid-event) become claimable again, and a
+process shutting down releases what it has not started so nothing is lost
+across restarts.
+"""
+
+import json
+import os
+import time
+
+import state_backend
+
+DEFAULT_CLAIM_TIMEOUT = 300.0
+
+
+class SharedQueue:
+    """Cross-process queue of JSON items with delays, claims and acks"""
+
+    def __init__(self, path="webhook_state.db", name="default", claim_timeout=DEFAULT_CLAIM_TIMEOUT):
+        self.path = str(path)
+        self.name = name
+        self.claim_timeout = float(claim_timeout)
+        # PIDs get reused, so a claimant is identified by PID and start time
+        self.owner = f"{os.getpid()}-{time.time():.0f}"
+        self._owner_pid = os.getpid()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue_items ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " queue TEXT NOT NULL,"
+            " due REAL NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " claimed_by TEXT,"
+            " claimed_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_items_due ON queue_items (queue, due)")
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=True)
+
+    def _owner(self):
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self.owner = f"{os.getpid()}-{time.time():.0f}"
+        return self.owner
+
+    def put(self, item, delay=0, max_depth=None):
+        """Add an item (due after delay seconds); returns False if max_depth items are already queued"""
+        return self.put_many([item], delay=delay, max_depth=max_depth) == 1
+
+    def put_many(self, items, delay=0, max_depth=None):
+        """Add items atomically, all or none; returns how many were added"""
+        if not items:
+            return 0
+        due = time.time() + max(0.0, float(delay))
+        rows = [(self.name, due, json.dumps(item)) for item in items]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if max_depth is not None and self._depth(conn) + len(rows) > max_depth:
+                conn.execute("COMMIT")
+                return 0
+            conn.executemany("INSERT INTO queue_items (queue, due, payload) VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def claim(self, limit):
+        """Claim up to limit due items for this process; returns [(id, item)] oldest first"""
+        if limit <= 0:
+            return []
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, payload FROM queue_items"
+                " WHERE queue = ? AND due <= ? AND (claimed_by IS NULL OR claimed_at < ?)"
+                " ORDER BY due, id LIMIT ?",
+                (self.name, now, now - self.claim_timeout, int(limit)),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE queue_items SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                    [(self._owner(), now, job_id) for job_id, _ in rows],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        claimed = []
+        for job_id, payload in rows:
+            try:
+                claimed.append((job_id, json.loads(payload)))
+            except ValueError:
+                self.ack([job_id])
+        return claimed
+
+    def ack(self, ids):
+        """Remove finished items"""
+        if ids:
+            self._conn().executemany("DELETE FROM queue_items WHERE id = ?", [(job_id,) for job_id in ids])
+
+    def release(self, ids):
+        """Hand claimed items back so another process can take them"""
+        if ids:
+            self._conn().executemany(
+                "UPDATE queue_items SET claimed_by = NULL, claimed_at = NULL WHERE id = ? AND claimed_by = ?",
+                [(job_id, self._owner()) for job_id in ids],
+            )
+
+    def next_due(self):
+        """Seconds until the next unclaimed item is due (0 if one is due now, None if there are none)"""
+        row = self._conn().execute(
+            "SELECT MIN(due) FROM queue_items WHERE queue = ? AND claimed_by IS NULL", (self.name,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def _depth(self, conn):
+        return conn.execute("SELECT COUNT(*) FROM queue_items WHERE queue = ?", (self.name,)).fetchone()[0]
+
+    def depth(self):
+        """Items queued or being processed, across every process"""
+        return self._depth(self._conn())
+
+    def stats(self):
+        rows = self._conn().execute(
+            "SELECT claimed_by IS NOT NULL, COUNT(*) FROM queue_items WHERE queue = ? GROUP BY 1", (self.name,)
+        ).fetchall()
+        counts = dict(rows)
+        return {"path": state_backend.get_backend().describe(self.path),
+                "waiting": counts.get(0, 0), "claimed": counts.get(1, 0)}
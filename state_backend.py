@@ -0,0 +1,120 @@
+"""
+Pluggable backend for state shared by every gunicorn worker and batch script.
+
+Webhook idempotency keys and pending objects (event_store), the webhook queue
+(shared_queue), the TPS cache, the rate limiter buckets, metrics and the
+result store each keep their state in a named store, and get their database
+connections from the backend chosen by STATE_BACKEND:
+
+- "sqlite" (default): embedded, no external service. Each store is a SQLite
+  file in WAL mode, so every process on the machine sees the same state and
+  it survives restarts. Relative store paths are placed under STATE_DIR if
+  that is set (e.g. a persistent disk mount).
+- "memory": throwaway stores in a temporary directory (in RAM under /dev/shm
+  where available), removed when the process that created them exits. Nothing
+  survives a restart; for tests and benchmarks.
+
+Stores speak SQLite SQL through the connection the backend hands out (one per
+thread per process, re-opened after a fork). Another backend can be added with
+register_backend(name, factory) before the first store is created; factory()
+must return an object with connect(name, autocommit) and describe().
+"""
+
+import atexit
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+_backends = {}
+_state = {"backend": None, "lock": threading.Lock()}
+
+
+class SQLiteBackend:
+    """One SQLite file per store, shared by every process that opens it"""
+
+    kind = "sqlite"
+    shared_across_processes = True
+
+    def __init__(self, directory=None):
+        self.directory = directory or None
+        self._local = threading.local()
+
+    def location(self, name):
+        name = str(name)
+        if self.directory and not os.path.isabs(name):
+            return os.path.join(self.directory, name)
+        return name
+
+    def _open(self, name, autocommit):
+        location = self.location(name)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(location, timeout=30, isolation_level=None if autocommit else "")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def connect(self, name, autocommit=False):
+        """
+        Return this thread's connection to store name. autocommit connections
+        leave transactions to the caller (BEGIN IMMEDIATE ... COMMIT); the
+        others open one implicitly, committed by "with conn:".
+        """
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conns = {}
+            local.pid = os.getpid()
+        key = (str(name), bool(autocommit))
+        conn = local.conns.get(key)
+        if conn is None:
+            conn = local.conns[key] = self._open(name, autocommit)
+        return conn
+
+    def describe(self, name):
+        return os.path.abspath(self.location(name))
+
+
+class MemoryBackend(SQLiteBackend):
+    """Stores in a temporary directory that is deleted at exit"""
+
+    kind = "memory"
+    shared_across_processes = False
+
+    def __init__(self):
+        # Shared-cache ":memory:" databases lock whole tables and ignore the busy timeout,
+        # so RAM-backed files are used instead to keep SQLite's normal WAL locking
+        ram = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        super().__init__(tempfile.mkdtemp(prefix="tps-state-", dir=ram))
+        atexit.register(self._remove, os.getpid())
+
+    def location(self, name):
+        return os.path.join(self.directory, os.path.basename(str(name)))
+
+    def _remove(self, pid):
+        if os.getpid() == pid:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def register_backend(kind, factory):
+    """Make a backend available as STATE_BACKEND=kind"""
+    _backends[kind] = factory
+
+
+register_backend("sqlite", lambda: SQLiteBackend(os.environ.get("STATE_DIR", "")))
+register_backend("memory", MemoryBackend)
+
+
+def get_backend():
+    """The process-wide backend selected by STATE_BACKEND (default sqlite)"""
+    backend = _state["backend"]
+    if backend is None:
+        with _state["lock"]:
+            backend = _state["backend"]
+            if backend is None:
+                kind = os.environ.get("STATE_BACKEND", "sqlite").strip().lower() or "sqlite"
+                if kind not in _backends:
+                    raise ValueError(f"Unknown STATE_BACKEND {kind!r} (available: {', '.join(sorted(_backends))})")
+                backend = _state["backend"] = _backends[kind]()
+    return backend
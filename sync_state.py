@@ -0,0 +1,167 @@
+"""
+Delta-sync watermarks and crash-safe checkpoints for the batch scripts.
+
+A watermark is the last-modified time (epoch milliseconds) of the newest
+record a delta run has fully handled, kept per object type in a small JSON
+file. The next delta run asks HubSpot only for records modified at or after
+it. The file is replaced atomically, so an interrupted run leaves the previous
+watermark in place rather than a half-written one.
+
+A checkpoint records how far a run got: the HubSpot paging cursor of the
+last batch whose results were saved, the numbers currently submitted to TPS,
+and TPS answers not yet saved to the result store. A restarted run resumes
+paging from the cursor and takes the saved answers instead of paying for
+those numbers again.
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_STATE_PATH = "sync_state.json"
+DEFAULT_CHECKPOINT_PATH = "checkpoint.json"
+
+
+def _read(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠ Could not read sync state {path}: {e}")
+        return {}
+
+
+def load_watermark(key, path=DEFAULT_STATE_PATH):
+    """Return the stored watermark for key in epoch ms, or None if there isn't one"""
+    value = _read(path).get(key, {}).get("modified_since")
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def save_watermark(key, modified_ms, path=DEFAULT_STATE_PATH):
+    """Store the watermark for key (never moves an existing watermark backwards)"""
+    state = _read(path)
+    current = state.get(key, {}).get("modified_since")
+    if current is not None and int(current) >= int(modified_ms):
+        return
+    state[key] = {
+        "modified_since": int(modified_ms),
+        "saved_at": _now(),
+    }
+    _write(path, state)
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _write(path, state):
+    """Replace path with state as JSON, flushed to disk before the rename"""
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """Durable progress of one batch run per object type, rewritten atomically on every change"""
+
+    def __init__(self, key, path=DEFAULT_CHECKPOINT_PATH):
+        self.key = key
+        self.path = str(path)
+        self._lock = threading.Lock()
+        saved = _read(self.path).get(key) or {}
+        self.cursor = saved.get("cursor")
+        self.answered = dict(saved.get("answered") or {})
+        self.submitted = list(saved.get("submitted") or [])
+        self.started_ms = saved.get("started_ms")
+
+    def _save(self):
+        state = _read(self.path)
+        state[self.key] = {
+            "started_ms": self.started_ms,
+            "cursor": self.cursor,
+            "submitted": self.submitted,
+            "answered": self.answered,
+            "saved_at": _now(),
+        }
+        _write(self.path, state)
+
+    def resumable(self):
+        return bool(self.cursor or self.answered or self.submitted)
+
+    def begin(self, now_ms):
+        """
+        Return when the run started (epoch ms): now_ms for a new run, or the
+        first attempt's start when resuming, which is kept until clear()
+        """
+        with self._lock:
+            if self.started_ms is None:
+                self.started_ms = int(now_ms)
+                self._save()
+            return self.started_ms
+
+    def answers_for(self, numbers):
+        """Return {number: result} for numbers answered by TPS but not yet saved"""
+        with self._lock:
+            return {n: self.answered[n] for n in numbers if n in self.answered}
+
+    def submit(self, numbers):
+        """Record numbers as sent to TPS, before the request goes out"""
+        with self._lock:
+            self.submitted = list(numbers)
+            self._save()
+
+    def answer(self, numbers, results):
+        """
+        Record TPS answers as soon as they arrive, before they are saved
+        anywhere else; numbers is all or part (one sub-batch) of what was submitted
+        """
+        with self._lock:
+            for number, result in zip(numbers, results):
+                if result is not None:
+                    self.answered[number] = result
+            answered = set(numbers)
+            self.submitted = [n for n in self.submitted if n not in answered]
+            self._save()
+
+    def advance(self, cursor, numbers=()):
+        """Mark a batch as saved: move the cursor and drop its answers from the checkpoint"""
+        with self._lock:
+            self.cursor = cursor
+            for number in numbers:
+                self.answered.pop(number, None)
+            self._save()
+
+    def clear(self):
+        """Forget the run once it has finished"""
+        with self._lock:
+            self.cursor, self.answered, self.submitted, self.started_ms = None, {}, [], None
+            state = _read(self.path)
+            if state.pop(self.key, None) is not None:
+                _write(self.path, state)
+
+
+def checkpointed_check(checkpoint, numbers, check_fn):
+    """
+    Return TPS results for numbers (same order), taking answers saved in the
+    checkpoint and recording the rest around the call to check_fn(numbers).
+    """
+    if checkpoint is None:
+        return check_fn(numbers)
+    saved = checkpoint.answers_for(numbers)
+    to_send = [n for n in dict.fromkeys(numbers) if n not in saved]
+    if to_send:
+        checkpoint.submit(to_send)
+        results = check_fn(to_send)
+        checkpoint.answer(to_send, results)
+        saved.update(zip(to_send, results))
+    return [saved.get(n) for n in numbers]
@@ -0,0 +1,187 @@
+"""
+Persistent TPS result cache shared by the webhook service and batch scripts.
+
+Results are stored in a local SQLite database keyed by normalized number,
+with the time they were checked. Entries older than the TTL are treated as
+misses, and the table is trimmed back to a maximum size by dropping the
+oldest checks.
+"""
+
+import json
+import os
+import threading
+import time
+
+import metrics
+import state_backend
+from phone_utils import normalize_uk_phone
+
+DEFAULT_TTL_DAYS = 28
+DEFAULT_MAX_ENTRIES = 1_000_000
+_EVICT_EVERY = 1000
+
+LOOKUPS = metrics.Counter("tps_cache_lookups_total", "TPS cache lookups")
+HITS = metrics.Counter("tps_cache_hits_total", "TPS cache lookups answered from the cache")
+metrics.Ratio("tps_cache_hit_ratio", "Share of TPS cache lookups that were hits", HITS.name, LOOKUPS.name)
+
+
+def cache_key(number):
+    """Key a number by its canonical UK form so formatting doesn't matter"""
+    return normalize_uk_phone(number)
+
+
+class TPSCache:
+    """SQLite-backed cache of TPS results with TTL and size-bounded eviction"""
+
+    def __init__(self, path="tps_cache.db", ttl_seconds=DEFAULT_TTL_DAYS * 86400, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = str(path)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._writes_since_evict = 0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tps_cache ("
+                " number TEXT PRIMARY KEY,"
+                " on_tps INTEGER NOT NULL,"
+                " on_ctps INTEGER NOT NULL,"
+                " result TEXT NOT NULL,"
+                " checked_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tps_cache_checked_at ON tps_cache (checked_at)")
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from TPS_CACHE_* environment variables (None if disabled)"""
+        path = os.environ.get("TPS_CACHE_PATH", "tps_cache.db")
+        if not path:
+            return None
+        try:
+            ttl_days = float(os.environ.get("TPS_CACHE_TTL_DAYS", str(DEFAULT_TTL_DAYS)))
+        except ValueError:
+            ttl_days = DEFAULT_TTL_DAYS
+        try:
+            max_entries = int(os.environ.get("TPS_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+        except ValueError:
+            max_entries = DEFAULT_MAX_ENTRIES
+        return cls(path, ttl_seconds=ttl_days * 86400, max_entries=max_entries)
+
+    def _conn(self):
+        return state_backend.get_backend().connect(self.path, autocommit=False)
+
+    # --- reads ---
+    def get(self, number):
+        return self.get_many([number]).get(cache_key(number))
+
+    def get_many(self, numbers):
+        """Return {cache_key: result} for fresh entries; counts hits and misses"""
+        keys = list(dict.fromkeys(k for k in (cache_key(n) for n in numbers) if k))
+        found = {}
+        if keys:
+            cutoff = time.time() - self.ttl_seconds
+            conn = self._conn()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT number, result FROM tps_cache WHERE number IN ({marks}) AND checked_at >= ?",
+                    (*chunk, cutoff),
+                ).fetchall()
+                for number, result in rows:
+                    found[number] = json.loads(result)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        if keys:
+            LOOKUPS.inc(len(keys))
+            HITS.inc(len(found))
+        return found
+
+    # --- writes ---
+    def put_many(self, results):
+        """Store {number: tps_result} pairs checked just now"""
+        now = time.time()
+        rows = []
+        for number, res in results.items():
+            key = cache_key(number)
+            if not key or not isinstance(res, dict):
+                continue
+            rows.append((
+                key,
+                1 if res.get("on_tps") else 0,
+                1 if res.get("on_ctps") else 0,
+                json.dumps(res),
+                now,
+            ))
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO tps_cache (number, on_tps, on_ctps, result, checked_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        with self._lock:
+            self._writes_since_evict += len(rows)
+            due = self._writes_since_evict >= _EVICT_EVERY
+            if due:
+                self._writes_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and trim the table to max_entries"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM tps_cache WHERE checked_at < ?", (time.time() - self.ttl_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM tps_cache").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM tps_cache WHERE number IN"
+                    " (SELECT number FROM tps_cache ORDER BY checked_at ASC LIMIT ?)",
+                    (excess,),
+                )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def cached_check(cache, numbers, check_fn, save=True):
+    """
+    Return TPS results for numbers (same order), only sending cache misses
+    to check_fn(numbers) -> list of results in order. With save=False the
+    caller caches fetched results itself (e.g. as each sub-batch returns).
+    """
+    if cache is None:
+        return check_fn(numbers)
+
+    found = cache.get_many(numbers)
+    misses = {}
+    for n in numbers:
+        key = cache_key(n) or n
+        if key not in found and key not in misses:
+            misses[key] = n
+
+    fetched = {}
+    if misses:
+        to_send = list(misses.values())
+        results = check_fn(to_send)
+        for idx, n in enumerate(to_send):
+            if idx < len(results) and results[idx] is not None:
+                fetched[cache_key(n) or n] = results[idx]
+        if save:
+            cache.put_many({misses[k]: res for k, res in fetched.items()})
+
+    out = []
+    for n in numbers:
+        key = cache_key(n) or n
+        out.append(found[key] if key in found else fetched.get(key))
+    return out
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+"""
+Non-interactive entry point for the bulk TPS jobs, for cron and job schedulers.
+
+    python tps_cli.py check --object-type contacts --limit 5000
+    python tps_cli.py check --object-type companies --delta
+    python tps_cli.py backfill --object-type companies --partitions 8 --concurrency 8
+    python tps_cli.py sync --object-type contacts
+    python tps_cli.py backfill --object-type companies --shard 2/4   # one of four processes or machines
+    python tps_cli.py merge --object-type companies
+
+check     check records with new or changed numbers (up to --limit), resuming
+          from the checkpoint of an interrupted run
+backfill  check every record in the portal, then set the delta sync watermark
+sync      write the stored TPS statuses back to HubSpot
+merge     fold the partitions written by --shard runs into the result store
+
+Flags override the matching environment settings (see README). The exit
+status is 0 on success and 1 if the job failed, so a scheduler can alert on it.
+Job modules are only imported once the arguments are parsed, so --help and
+argument errors return immediately.
+"""
+
+import argparse
+import sys
+
+OBJECT_TYPES = ("contacts", "companies")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="tps_cli.py", description="Bulk TPS checks against HubSpot")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def job(name, help_text):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--object-type", choices=OBJECT_TYPES, default=None,
+                       help="HubSpot object type (default: the one in HUBSPOT_ENDPOINT, else contacts)")
+        p.add_argument("--quiet", action="store_true", help="only print the final summary")
+        if name != "merge":
+            p.add_argument("--shard", default=None, metavar="I/N",
+                           help="only the objects whose ID hashes to shard I of N (SHARD, see sharding.py)")
+            p.add_argument("--split-rate", dest="shard_rate_split", action="store_true", default=None,
+                           help="give this shard 1/N of each API rate limit, for shards on machines that "
+                                "don't share RATE_LIMIT_STATE_PATH (SHARD_RATE_SPLIT)")
+        return p
+
+    for name, help_text in (("check", "check new or changed numbers"), ("backfill", "check the whole portal")):
+        p = job(name, help_text)
+        p.add_argument("--concurrency", type=int, default=None, help="TPS sub-batches in flight (TPS_CONCURRENCY)")
+        p.add_argument("--batch-size", type=int, default=None, help="records per TPS batch (BATCH_SIZE)")
+        p.add_argument("--sub-batch-size", type=int, default=None,
+                       help="numbers per TPS request, or the starting size when adaptive (TPS_SUB_BATCH_SIZE)")
+        p.add_argument("--fixed-sub-batch", dest="adaptive_batch", action="store_false", default=None,
+                       help="keep TPS requests at --sub-batch-size instead of adapting it (TPS_ADAPTIVE_BATCH=0)")
+        p.add_argument("--partitions", type=int, default=None, help="ID ranges fetched in parallel (FETCH_PARTITIONS)")
+        p.add_argument("--fetch-workers", type=int, default=None, help="ranges fetched at once (FETCH_WORKERS)")
+        if name == "check":
+            p.add_argument("--limit", type=int, default=None, help="stop after this many records (default: all)")
+            p.add_argument("--delta", action="store_true", default=None,
+                           help="only records modified since the last delta run (DELTA_SYNC)")
+    p = job("sync", "write stored TPS statuses to HubSpot")
+    p.add_argument("--limit", type=int, default=None, help="stop after this many records (default: all)")
+    p = job("merge", "fold shard partitions into the result store")
+    p.add_argument("paths", nargs="*", metavar="partition",
+                   help="partition files (default: all next to RESULT_STORE_PATH)")
+    return parser
+
+
+def main(argv=None, default_object_type="contacts"):
+    args = build_parser().parse_args(argv)
+
+    import config as settings
+
+    # Loaded before the job modules, which read some settings at import
+    settings.load_env()
+    import tps_jobs
+
+    try:
+        config = tps_jobs.JobConfig.from_env(
+            args.object_type,
+            default_object_type,
+            shard=getattr(args, "shard", None),
+            shard_rate_split=getattr(args, "shard_rate_split", None),
+            tps_concurrency=getattr(args, "concurrency", None),
+            batch_size=getattr(args, "batch_size", None),
+            tps_sub_batch_size=getattr(args, "sub_batch_size", None),
+            fetch_partitions=getattr(args, "partitions", None),
+            fetch_workers=getattr(args, "fetch_workers", None),
+            delta_sync=getattr(args, "delta", None),
+            adaptive_batch=getattr(args, "adaptive_batch", None),
+        )
+    except ValueError as e:
+        # A bad --shard / SHARD or object type
+        print(f"✗ {e}")
+        return 2
+    echo = (lambda *a, **k: None) if args.quiet else print
+
+    print("=" * 70)
+    label = f" (shard {config.shard})" if config.shard and args.command != "merge" else ""
+    print(f"TPS {args.command.upper()} - {config.object_type}{label}")
+    print("=" * 70)
+    if args.command == "check":
+        summary = tps_jobs.run_check(config, limit=args.limit, echo=echo)
+    elif args.command == "backfill":
+        summary = tps_jobs.run_backfill(config, echo=echo)
+    elif args.command == "merge":
+        summary = tps_jobs.run_merge(config, paths=args.paths, echo=echo)
+    else:
+        summary = tps_jobs.run_sync(config, limit=args.limit, echo=echo)
+    return report(args.command, config, summary)
+
+
+def report(command, config, summary):
+    print()
+    print("=" * 70)
+    if command == "merge":
+        if summary["error"]:
+            print(f"✗ {summary['error']}")
+            return 1
+        print("MERGE COMPLETE!")
+        print(f"  ✓ Partitions merged: {summary['partitions']}")
+        print(f"  ✓ Results taken from them: {summary['merged']}")
+        print(f"  📄 Result store: {summary['store']}")
+        print("=" * 70)
+        return 0
+    if command == "sync":
+        if summary["error"]:
+            print(f"✗ {summary['error']}")
+            return 1
+        print("SYNC COMPLETE!")
+        print(f"  ✓ Successfully updated: {summary['updated']}")
+        print(f"  = Already up to date: {summary['unchanged']}")
+        print(f"  ✗ Failed: {summary['failed']}")
+        print("=" * 70)
+        return 1 if summary["failed"] else 0
+
+    print(f"{command.upper()} {'FAILED' if summary['failed'] else 'COMPLETE'}!")
+    print(f"  ✓ {config.object_type.capitalize()} checked: {summary['records']}")
+    print(f"  ✓ Processed: {summary['processed']} phone numbers")
+    if summary["quarantined"]:
+        print(f"  ⚠ Quarantined: {summary['quarantined']} numbers TPS refused (python result_store.py quarantine)")
+    if summary["tps_seconds"]:
+        print(f"  ⏱ TPS throughput: {summary['numbers'] / summary['tps_seconds']:.0f} numbers/s")
+    print(f"  📄 Results saved to: {summary['store']} (python result_store.py export {config.object_type} for CSV)")
+    print("=" * 70)
+    if summary["failed"]:
+        print(f"Progress is checkpointed in {config.shard_path(config.checkpoint_path)} - run again to resume")
+        return 1
+    if not summary["exhausted"]:
+        print("Run again to check more records")
+    else:
+        print(f"No new {config.object_type} left to check!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
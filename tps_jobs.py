@@ -0,0 +1,646 @@
+"""
+Importable core of the bulk TPS jobs: checking numbers, backfilling a whole
+portal and writing stored results back to HubSpot.
+
+Nothing happens at import time. Settings are read into a JobConfig
+(JobConfig.from_env(), with per-run overrides), and each job is a function
+that takes one, prints its progress through echo and returns a summary dict,
+so the same code runs from tps_cli.py under a scheduler, from the legacy
+scripts, or from a benchmark. Call config.load_env() before importing this
+module if settings come from env/.env.
+"""
+
+import itertools
+import json
+import os
+import time
+from functools import partial
+from pathlib import Path
+
+import requests
+
+import metrics
+from batch_sizer import AdaptiveBatchSizer
+from circuit_breaker import CircuitOpenError, get_breaker
+from config import env_flag, env_int
+from http_client import tps_request
+from hubspot_reader import iter_all_objects, iter_modified_since, iter_pages, modified_millis
+from hubspot_writer import HubSpotBatchWriter
+from phone_utils import build_batch
+from pipeline import Sink, batched, map_batched, prefetch
+from rate_limiter import set_share
+from result_store import ResultStore, iter_unchecked
+from sharding import Shard, partition_paths
+from sync_state import Checkpoint, checkpointed_check, load_watermark, save_watermark
+from tps_cache import TPSCache, cached_check
+
+HUBSPOT_OBJECTS_URL = "https://api.hubapi.com/crm/v3/objects"
+DEFAULT_TPS_ENDPOINT = "https://api.tpsservices.co.uk/check"
+LEGACY_CSV = "tps_results.csv"
+
+QUARANTINED = metrics.Counter("tps_numbers_quarantined_total", "Numbers isolated from refused TPS requests")
+# Refused numbers isolated from one request before the refusal is taken to be request-wide
+MAX_ISOLATED = 3
+
+# Per object type: HubSpot number properties and the result field each is stored
+# under, the last-modified property delta sync filters on, and the property
+# each field's status is written back to
+OBJECT_TYPES = {
+    "contacts": {
+        "numbers": {"phone": "phone", "mobilephone": "mobile"},
+        "modified": "lastmodifieddate",
+        "status_properties": {"phone": "tps_status_contact", "mobile": "mobile_phone___tps"},
+    },
+    "companies": {
+        "numbers": {"phone": "phone"},
+        "modified": "hs_lastmodifieddate",
+        "status_properties": {"phone": "tps_status"},
+    },
+}
+
+
+class JobConfig:
+    """Settings for one job run"""
+
+    def __init__(self, object_type, hubspot_endpoint, hubspot_token, tps_endpoint, tps_api_key,
+                 batch_size=10000, pipeline_buffer=1000, fetch_partitions=1, fetch_workers=4,
+                 tps_sub_batch_size=1000, tps_concurrency=4, delta_sync=False,
+                 sync_state_path="sync_state.json", checkpoint_path="checkpoint.json", adaptive_batch=True,
+                 result_store_path="tps_results.db", shard=None, shard_rate_split=False):
+        if object_type not in OBJECT_TYPES:
+            raise ValueError(f"Unsupported object type {object_type!r} (expected one of {', '.join(OBJECT_TYPES)})")
+        self.object_type = object_type
+        self.hubspot_endpoint = hubspot_endpoint
+        self.hubspot_token = hubspot_token
+        self.tps_endpoint = tps_endpoint
+        self.tps_api_key = tps_api_key
+        self.batch_size = max(1, int(batch_size))
+        self.pipeline_buffer = max(1, int(pipeline_buffer))
+        self.fetch_partitions = max(1, int(fetch_partitions))
+        self.fetch_workers = max(1, int(fetch_workers))
+        self.tps_sub_batch_size = max(1, int(tps_sub_batch_size))
+        self.tps_concurrency = max(1, int(tps_concurrency))
+        self.delta_sync = bool(delta_sync)
+        self.sync_state_path = sync_state_path
+        self.checkpoint_path = checkpoint_path
+        self.adaptive_batch = bool(adaptive_batch)
+        self.result_store_path = result_store_path
+        # Only the objects of this shard (a Shard, or "i/N"); None for all of them
+        self.shard = Shard.parse(shard)
+        self.shard_rate_split = bool(shard_rate_split)
+
+    @classmethod
+    def from_env(cls, object_type=None, default_object_type="contacts", **overrides):
+        """
+        Build a config from the environment. object_type swaps the object in
+        HUBSPOT_ENDPOINT (default: the endpoint's own, else default_object_type);
+        overrides that are None are ignored.
+        """
+        endpoint = os.environ.get("HUBSPOT_ENDPOINT", "").rstrip("/")
+        base, _, own_type = endpoint.rpartition("/") if endpoint else (HUBSPOT_OBJECTS_URL, "", "")
+        object_type = object_type or own_type or default_object_type
+        settings = {
+            "object_type": object_type,
+            "hubspot_endpoint": f"{base or HUBSPOT_OBJECTS_URL}/{object_type}",
+            "hubspot_token": os.environ.get("HUBSPOT_ACCESS_TOKEN", "your_hubspot_access_token"),
+            "tps_endpoint": os.environ.get("TPS_ENDPOINT", DEFAULT_TPS_ENDPOINT),
+            "tps_api_key": os.environ.get("TPS_API_KEY", "your_tps_api_key"),
+            "batch_size": env_int("BATCH_SIZE", 10000),
+            "pipeline_buffer": env_int("PIPELINE_BUFFER", 1000),
+            # FETCH_PARTITIONS > 1 exports ID ranges in parallel through the search API
+            "fetch_partitions": env_int("FETCH_PARTITIONS", 1),
+            "fetch_workers": env_int("FETCH_WORKERS", 4),
+            # Each batch goes to TPS as sub-batches, several in flight at once
+            "tps_sub_batch_size": env_int("TPS_SUB_BATCH_SIZE", 1000),
+            "tps_concurrency": env_int("TPS_CONCURRENCY", 4),
+            # ... sized adaptively from TPS_SUB_BATCH_SIZE (see batch_sizer.py) unless TPS_ADAPTIVE_BATCH=0
+            "adaptive_batch": os.environ.get("TPS_ADAPTIVE_BATCH", "1").strip().lower() not in ("0", "false", "no"),
+            "delta_sync": env_flag("DELTA_SYNC"),
+            "sync_state_path": os.environ.get("SYNC_STATE_PATH", "sync_state.json"),
+            "checkpoint_path": os.environ.get("CHECKPOINT_PATH", "checkpoint.json"),
+            "result_store_path": os.environ.get("RESULT_STORE_PATH", "tps_results.db"),
+            # SHARD=i/N checks only that shard of the objects (see sharding.py)
+            "shard": os.environ.get("SHARD") or None,
+            "shard_rate_split": env_flag("SHARD_RATE_SPLIT"),
+        }
+        settings.update({k: v for k, v in overrides.items() if v is not None})
+        return cls(**settings)
+
+    @property
+    def profile(self):
+        return OBJECT_TYPES[self.object_type]
+
+    @property
+    def fields(self):
+        return tuple(self.profile["numbers"].values())
+
+    def shard_path(self, path):
+        """This run's own copy of a state file: path itself, or the shard's copy of it"""
+        return self.shard.path(path) if self.shard else path
+
+    def apply_shard_rate(self, echo=print):
+        """With shard_rate_split, hold this shard to its 1/N of each rate limit in buckets of its own"""
+        if self.shard and self.shard_rate_split:
+            set_share(1.0 / self.shard.count, f"shard-{self.shard.index}-of-{self.shard.count}")
+            echo(f"ℹ Shard {self.shard}: using 1/{self.shard.count} of each API rate limit")
+
+
+# --- TPS ---
+class TPSAPIError(Exception):
+    """TPS answered with something other than 200"""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        super().__init__(f"TPS API returned {status_code}: {text[:200]}")
+
+    @property
+    def refused(self):
+        """
+        True if TPS refused the numbers sent (400 or 422), which retrying the
+        same numbers won't change but leaving out a bad one may
+        """
+        return self.status_code in (400, 422)
+
+    @property
+    def fatal(self):
+        """
+        True if TPS refused the API key or account (401, 402 or 403): no
+        request will succeed until someone fixes it, so the run should stop
+        """
+        return self.status_code in (401, 402, 403)
+
+
+def post_tps_chunk(numbers, endpoint, api_key, sizer=None):
+    """One TPS request; results in the same order as numbers. Fed back to sizer if given."""
+    headers = {
+        "Authorization": api_key,
+        "Content-Type": "application/json",
+        "check-tps": "true",
+        "check-ctps": "true"
+    }
+    body = json.dumps({"phone_numbers": numbers})
+    # Above the sizer's minimum a timeout most likely means the request was too large: it goes
+    # straight back to the sizer (and post_tps_sized) instead of being retried and opening the breaker
+    size_timeouts = sizer is not None and len(numbers) > sizer.minimum
+    started = time.monotonic()
+    try:
+        r = tps_request("POST", endpoint, headers=headers, data=body, retry_timeouts=not size_timeouts)
+    except CircuitOpenError:
+        # Says nothing about the batch size
+        raise
+    except requests.Timeout:
+        if sizer:
+            sizer.record(len(numbers), time.monotonic() - started, len(body), error="timeout")
+        raise
+    except requests.RequestException as e:
+        if sizer:
+            sizer.record(len(numbers), time.monotonic() - started, len(body), error=type(e).__name__)
+        raise
+    if r.status_code != 200:
+        error = TPSAPIError(r.status_code, r.text)
+        # A refused number or API key says nothing about the batch size either
+        if sizer and not (error.refused or error.fatal):
+            sizer.record(len(numbers), r.elapsed.total_seconds(), len(body),
+                         error="too_large" if r.status_code == 413 else str(r.status_code))
+        raise error
+    if sizer:
+        # The final attempt's own latency, without rate-limit waits or earlier retries
+        sizer.record(len(numbers), r.elapsed.total_seconds(), len(body))
+    return r.json().get("results", [])
+
+
+def post_tps_sized(numbers, endpoint, api_key, sizer):
+    """
+    post_tps_chunk, but a request refused as too large (413) or timed out is
+    sent again in pieces of the size the sizer has shrunk to, rather than
+    failing the batch.
+    """
+    try:
+        return post_tps_chunk(numbers, endpoint, api_key, sizer)
+    except (TPSAPIError, requests.Timeout) as e:
+        too_large = isinstance(e, requests.Timeout) or e.status_code == 413
+        if not too_large or len(numbers) <= sizer.minimum:
+            raise
+    size = max(1, min(sizer.size(), len(numbers) // 2))
+    results = []
+    for i in range(0, len(numbers), size):
+        piece = numbers[i:i + size]
+        part = list(post_tps_sized(piece, endpoint, api_key, sizer) or [])[:len(piece)]
+        results.extend(part + [None] * (len(piece) - len(part)))
+    return results
+
+
+def post_tps_isolating(numbers, endpoint, api_key, sizer=None, quarantine=None):
+    """
+    post_tps_sized (post_tps_chunk without a sizer), but a request TPS refuses
+    outright - presumably over one bad number - is split in halves and each
+    half sent again, down to the single numbers it refuses. Those get no result
+    and are passed to quarantine(number, reason); every other number in the
+    batch is still answered, for about 2 * log2(len(numbers)) extra requests
+    per bad number. If more than MAX_ISOLATED numbers (or half the request)
+    turn out to be refused, the refusal is taken to be request-wide - a bad
+    header, account or payload - and raised as a TPSAPIError without
+    quarantining anything. Transient failures (5xx, timeouts, connection
+    errors) were already retried by http_client and are raised as before, as
+    are refused API keys or accounts (TPSAPIError.fatal).
+    """
+    post = partial(post_tps_sized if sizer else post_tps_chunk, endpoint=endpoint, api_key=api_key, sizer=sizer)
+    try:
+        return post(numbers)
+    except TPSAPIError as e:
+        if not e.refused:
+            raise
+        first = e
+    limit = max(1, min(MAX_ISOLATED, len(numbers) // 2))
+    refused = {}
+
+    def isolate(piece, error):
+        if len(piece) == 1:
+            refused[piece[0]] = str(error)
+            if len(refused) > limit:
+                # Stops the search too, so a request-wide refusal costs at most ~limit * log2(n) requests
+                raise TPSAPIError(first.status_code, f"refused more than {limit} of {len(numbers)} numbers, "
+                                                     f"so not blaming single numbers: {first.text}")
+            return [None]
+        half = len(piece) // 2
+        results = []
+        for part in (piece[:half], piece[half:]):
+            try:
+                answered = list(post(part) or [])[:len(part)]
+                answered += [None] * (len(part) - len(answered))
+            except TPSAPIError as e:
+                if not e.refused:
+                    raise
+                answered = isolate(part, e)
+            results.extend(answered)
+        return results
+
+    results = isolate(numbers, first)
+    # Quarantined only once the refusal is known to be down to these numbers
+    for number, reason in refused.items():
+        QUARANTINED.inc()
+        if quarantine:
+            quarantine(number, reason)
+    return results
+
+
+def batch_sizer(config):
+    """The adaptive TPS request sizer for a run (None for fixed-size requests)"""
+    if not config.adaptive_batch:
+        return None
+    return AdaptiveBatchSizer.from_env(config.tps_sub_batch_size)
+
+
+def check_numbers(config, numbers, checkpoint=None, cache=None, sizer=None, quarantine=None):
+    """
+    Check numbers against TPS (same order), answering from the checkpoint and
+    cache where possible and sending the rest as concurrent sub-batches, sized
+    by sizer if given (else config.tps_sub_batch_size). Numbers TPS refuses are
+    isolated and passed to quarantine(number, reason), with None results.
+    Each sub-batch's answers are checkpointed and cached as soon as it
+    returns, so a failing sibling doesn't cost answers TPS already gave.
+    """
+    def keep(chunk, results):
+        if checkpoint:
+            checkpoint.answer(chunk, results)
+        if cache:
+            cache.put_many({n: r for n, r in zip(chunk, results) if r is not None})
+
+    def send(to_send):
+        chunk = partial(post_tps_isolating, endpoint=config.tps_endpoint, api_key=config.tps_api_key,
+                        sizer=sizer, quarantine=quarantine)
+        size = sizer.size if sizer else config.tps_sub_batch_size
+        return map_batched(chunk, to_send, size, config.tps_concurrency, name="tps", on_chunk=keep)
+    return checkpointed_check(checkpoint, numbers, lambda ns: cached_check(cache, ns, send, save=False))
+
+
+def tps_status(result):
+    listed = result.get("on_tps", False) or result.get("on_ctps", False)
+    return "Listed" if listed else "Not Listed"
+
+
+# --- result store ---
+def open_store(config, echo=print, partition=False):
+    """
+    Open the result store. With partition set, a sharded run gets its shard's
+    partition instead, which reads the main store's results but writes only
+    its own. The legacy tps_results.csv is not imported: it mixes contact and
+    company IDs, so only the operator can say which object type it belongs to.
+    """
+    object_type = config.object_type
+    store = ResultStore(config.result_store_path)
+    count = store.count(object_type)
+    if not count and Path(LEGACY_CSV).exists():
+        echo(f"ℹ {LEGACY_CSV} is not imported automatically - if it holds {object_type} results, run "
+             f"python result_store.py import {object_type} {LEGACY_CSV}")
+    if partition and config.shard:
+        return ResultStore(config.shard_path(config.result_store_path), base=store), count
+    return store, count
+
+
+# --- check / backfill ---
+def iter_records(config, store, checkpoint, scan, echo=print):
+    """
+    Yield {"id", <fields>, "modified", "cursor"} for records with a new or
+    changed number, fetched in the background. scan tracks the cursor and
+    last-modified time of the newest record pulled off the stream, and
+    whether the stream ran to the end.
+    """
+    profile = config.profile
+    properties = list(profile["numbers"])
+    partitions = config.fetch_partitions
+    if config.delta_sync:
+        since = load_watermark(config.object_type, config.shard_path(config.sync_state_path))
+        if since is None and config.shard:
+            # A shard's first delta run starts from the merged watermark of earlier runs
+            since = load_watermark(config.object_type, config.sync_state_path)
+        since = since or 0
+        echo(f"Fetching {config.object_type} modified since {since} (delta sync)...")
+        found = prefetch(
+            iter_modified_since(config.hubspot_endpoint, config.hubspot_token, properties, since, profile["modified"]),
+            maxsize=config.pipeline_buffer, name="hubspot-fetch",
+        )
+        objects = ((None, obj) for obj in found)
+    elif partitions > 1:
+        echo(f"Fetching {config.object_type} from HubSpot ({partitions} partitions)...")
+        found = iter_all_objects(
+            config.hubspot_endpoint, config.hubspot_token, properties,
+            partitions=partitions, workers=config.fetch_workers, buffer=config.pipeline_buffer,
+        )
+        objects = ((None, obj) for obj in found)
+    else:
+        # Plain paging can resume from the checkpointed cursor
+        echo(f"Fetching {config.object_type} from HubSpot...")
+        pages = prefetch(
+            iter_pages(config.hubspot_endpoint, config.hubspot_token, properties, after=checkpoint.cursor),
+            maxsize=max(1, config.pipeline_buffer // 100), name="hubspot-fetch",
+        )
+        objects = ((cursor, obj) for cursor, page in pages for obj in page)
+    if config.shard:
+        # Every shard pages through the portal but keeps only its own objects
+        objects = ((cursor, obj) for cursor, obj in objects if config.shard.owns(obj["id"]))
+    records = (
+        {
+            "id": obj["id"],
+            **{field: obj.get("properties", {}).get(prop) for prop, field in profile["numbers"].items()},
+            "modified": modified_millis(obj, profile["modified"]),
+            "cursor": cursor,
+        }
+        for cursor, obj in objects
+    )
+    # Fields whose number hasn't changed since it was last checked, is invalid or is quarantined come
+    # back blanked, so they don't count towards a --limit
+    for record in iter_unchecked(store, config.object_type, records, config.fields):
+        scan["cursor"] = record["cursor"]
+        if record["modified"] is not None:
+            scan["modified"] = max(scan["modified"] or 0, record["modified"])
+        if any(record[field] for field in config.fields):
+            yield record
+    scan["exhausted"] = True
+
+
+def run_check(config, limit=None, echo=print):
+    """
+    Check up to limit records (all of them if None) with new or changed
+    numbers and save the results, checkpointing after every saved batch so an
+    interrupted or failed run resumes where it stopped. Numbers TPS refuses
+    are quarantined in the store and skipped rather than failing their batch.
+    A sharded run checks only its shard's records, into its own partition of
+    the store, with its own checkpoint and watermark.
+    Returns a summary with "failed" set if a TPS batch failed.
+    """
+    store, checked_before = open_store(config, echo, partition=True)
+    checkpoint_path = config.shard_path(config.checkpoint_path)
+    config.apply_shard_rate(echo)
+    cache = TPSCache.from_env()
+    sizer = batch_sizer(config)
+    checkpoint = Checkpoint(config.object_type, checkpoint_path)
+    if config.shard:
+        echo(f"ℹ Shard {config.shard}: saving to {store.location} (python tps_cli.py merge when all shards are done)")
+    if checked_before:
+        echo(f"✓ {checked_before} {config.object_type} numbers already checked in {(store.base or store).location}")
+    else:
+        echo(f"ℹ No existing results - will check all {config.object_type}")
+    if checkpoint.resumable():
+        echo(f"✓ Resuming from {checkpoint_path}: {len(checkpoint.answered)} TPS answers waiting to be saved")
+        if checkpoint.submitted:
+            echo(f"⚠ {len(checkpoint.submitted)} numbers were sent to TPS without a recorded answer; they will be re-sent")
+
+    def save_results(item):
+        # Record one checked batch, then checkpoint past it (runs on the writer thread)
+        numbers, mapping, results, cursor = item
+        rows = []
+        for idx, res in enumerate(results):
+            if not res:
+                continue
+            status = tps_status(res)
+            for field, object_id in mapping[idx]:
+                rows.append((object_id, field, numbers[idx], status))
+        saved = store.record_many(config.object_type, rows)
+        checkpoint.advance(cursor, numbers)
+        if numbers:
+            echo(f"  ✓ Saved {saved} results to {store.location}")
+
+    quarantined = {}
+
+    def quarantine(number, reason):
+        # Runs on the TPS request threads
+        quarantined[number] = reason
+        store.quarantine_many({number: reason})
+
+    summary = {"records": 0, "numbers": 0, "processed": 0, "quarantined": 0, "failed": False,
+               "exhausted": False, "watermark": None, "tps_seconds": 0.0,
+               "started_ms": checkpoint.begin(time.time() * 1000)}
+    scan = {"cursor": None, "modified": None, "exhausted": False}
+    records = iter_records(config, store, checkpoint, scan, echo)
+    if limit is not None:
+        records = itertools.islice(records, limit)
+    # Only advanced past batches that were checked successfully
+    watermark = None
+    sink = Sink(save_results, maxsize=2, name="result-writer")
+    try:
+        for batch_num, batch in enumerate(batched(records, config.batch_size), 1):
+            summary["records"] += len(batch)
+            batch_cursor, batch_modified = scan["cursor"], scan["modified"]
+            entries = [(field, r["id"], r[field]) for r in batch for field in config.fields if r[field]]
+            # Normalize and de-duplicate; mapping[idx] lists every record field sharing numbers[idx]
+            numbers, mapping, invalid = build_batch(entries)
+            echo(f"Checking batch {batch_num} ({len(batch)} {config.object_type})...")
+            echo(f"  Phone numbers to check: {len(numbers)} unique ({len(entries)} fields, {len(invalid)} invalid)")
+            if not numbers:
+                sink.put(([], mapping, [], batch_cursor))
+                watermark = batch_modified
+                continue
+            held = store.quarantined(numbers)
+            if held:
+                echo(f"  ⚠ Skipping {len(held)} quarantined numbers (python result_store.py quarantine)")
+            to_check = [n for n in numbers if n not in held]
+            try:
+                started = time.monotonic()
+                checked = check_numbers(config, to_check, checkpoint, cache, sizer, quarantine)
+                elapsed = time.monotonic() - started
+            except CircuitOpenError as e:
+                # Stop at once rather than failing every remaining batch
+                echo(f"  ✗ TPS unavailable ({e})")
+                echo(f"  Progress is checkpointed in {checkpoint_path} - run again to resume from this batch")
+                summary["failed"] = True
+                break
+            except Exception as e:
+                if isinstance(e, TPSAPIError) and e.fatal:
+                    echo(f"  ✗ TPS refused the API key or account ({str(e)[:100]}) - check TPS_API_KEY")
+                else:
+                    echo(f"  ✗ Error: {str(e)[:100]}")
+                echo(f"  Progress is checkpointed in {checkpoint_path} - run again to resume from this batch")
+                summary["failed"] = True
+                break
+            if held:
+                answers = dict(zip(to_check, checked))
+                results = [answers.get(n) for n in numbers]
+            else:
+                results = checked
+            if quarantined:
+                echo(f"  ⚠ Quarantined {len(quarantined)} numbers TPS refused:")
+                for number, reason in list(quarantined.items())[:5]:
+                    echo(f"    {number}: {reason[:100]}")
+                summary["quarantined"] += len(quarantined)
+                quarantined.clear()
+            summary["numbers"] += len(to_check)
+            summary["tps_seconds"] += elapsed
+            echo(f"  ⏱ {len(numbers)} numbers in {elapsed:.1f}s ({len(numbers) / max(elapsed, 0.001):.0f}/s)")
+            if cache:
+                stats = cache.stats()
+                echo(f"  TPS cache: {stats['hits']} hits / {stats['misses']} misses")
+            if sizer:
+                echo(f"  TPS request size: {sizer.size()} numbers")
+            sink.put((numbers, mapping, results, batch_cursor))
+            summary["processed"] += len([r for r in results if r])
+            watermark = batch_modified
+    finally:
+        sink.close()
+
+    if not summary["failed"]:
+        # Everything pulled off the stream was handled, including skipped records after the last batch
+        watermark = scan["modified"]
+        summary["exhausted"] = scan["exhausted"]
+        if scan["exhausted"]:
+            checkpoint.clear()
+        else:
+            checkpoint.advance(scan["cursor"])
+    if config.delta_sync and watermark is not None:
+        save_watermark(config.object_type, watermark, config.shard_path(config.sync_state_path))
+        summary["watermark"] = watermark
+        echo(f"✓ Delta sync watermark saved: {watermark}")
+    summary["store"] = store.location
+    return summary
+
+
+def run_backfill(config, echo=print):
+    """
+    Check every record in the portal (a partitioned export if fetch_partitions > 1).
+    When it completes, the delta sync watermark is set to the time the run
+    started, so later delta checks pick up anything modified since. A resumed
+    run uses its first attempt's start (kept in the checkpoint): records before
+    the resume point may have changed while it was stopped.
+    """
+    full = JobConfig(**{**vars(config), "delta_sync": False})
+    summary = run_check(full, limit=None, echo=echo)
+    started_ms = summary["started_ms"]
+    if not summary["failed"] and summary["exhausted"]:
+        save_watermark(config.object_type, started_ms, config.shard_path(config.sync_state_path))
+        summary["watermark"] = started_ms
+        echo(f"✓ Delta sync watermark saved: {started_ms}")
+    return summary
+
+
+# --- sync (write-back) ---
+def iter_statuses(store, object_type):
+    """Yield (object_id, {field: status}) straight from the store, which is ordered by ID"""
+    rows = store.iter_results(object_type)
+    for object_id, group in itertools.groupby(rows, key=lambda row: row[1]):
+        yield object_id, {field: status for _, _, field, _, status, _ in group}
+
+
+def run_sync(config, limit=None, echo=print):
+    """
+    Write stored TPS statuses to HubSpot, skipping records that already hold
+    them (known from the store or one batch read per batch of writes).
+    A sharded run writes only its shard's records, from the merged store.
+    """
+    store, count = open_store(config, echo)
+    config.apply_shard_rate(echo)
+    summary = {"records": 0, "updated": 0, "unchanged": 0, "failed": 0, "error": None, "store": store.location}
+    if not count:
+        summary["error"] = f"No {config.object_type} results in {store.location}"
+        echo(f"✗ {summary['error']}")
+        return summary
+    echo(f"✓ {count} {config.object_type} results in {store.location}")
+    echo(f"Updating HubSpot {config.object_type}...")
+
+    status_properties = config.profile["status_properties"]
+    writer = HubSpotBatchWriter(config.hubspot_endpoint, config.hubspot_token, store=store,
+                                object_type=config.object_type)
+    breaker = get_breaker("hubspot")
+    statuses = iter_statuses(store, config.object_type)
+    if config.shard:
+        statuses = ((object_id, by_field) for object_id, by_field in statuses if config.shard.owns(object_id))
+    if limit is not None:
+        statuses = itertools.islice(statuses, limit)
+    for object_id, by_field in statuses:
+        if summary["records"] % writer.batch_size == 0 and breaker.state() == "open":
+            # Writes would only fail fast from here; a later run resumes (unchanged records are skipped)
+            summary["error"] = f"HubSpot unavailable (circuit open) after {summary['records']} records - run again later"
+            echo(f"✗ {summary['error']}")
+            break
+        properties = {"tps_checked": "true"}  # Always mark as checked
+        for field, status in by_field.items():
+            if status and field in status_properties:
+                properties[status_properties[field]] = status
+        before = writer.updated
+        writer.update(object_id, properties)
+        summary["records"] += 1
+        if writer.updated // 1000 > before // 1000:
+            echo(f"  ✓ Updated {writer.updated} {config.object_type}...")
+
+    writer.flush()
+    for object_id, reason in list(writer.failed.items())[:50]:
+        echo(f"  ✗ {object_id}: {reason}")
+    if len(writer.failed) > 50:
+        echo(f"  ✗ ... and {len(writer.failed) - 50} more")
+    summary.update(updated=writer.updated, unchanged=writer.unchanged, failed=len(writer.failed))
+    return summary
+
+
+# --- merge (sharded runs) ---
+def run_merge(config, paths=None, echo=print):
+    """
+    Fold shard partitions (paths, else every one found next to the result
+    store) into the result store. When every shard of a run has a delta
+    watermark, the oldest of them becomes the unsharded watermark, so a later
+    unsharded delta run misses nothing any shard hadn't seen.
+    """
+    store, _ = open_store(config, echo)
+    paths = list(paths or partition_paths(config.result_store_path))
+    summary = {"partitions": 0, "merged": 0, "store": store.location, "error": None, "watermark": None}
+    if not paths:
+        summary["error"] = f"No shard partitions found next to {config.result_store_path}"
+        echo(f"✗ {summary['error']}")
+        return summary
+    for path in paths:
+        merged = store.merge(path)
+        summary["partitions"] += 1
+        summary["merged"] += merged
+        echo(f"  ✓ {path}: {merged} results merged")
+
+    counts = {int(Path(p).stem.rsplit("-of-", 1)[1]) for p in paths if "-of-" in Path(p).stem}
+    for count in counts:
+        shards = [Shard(i, count) for i in range(1, count + 1)]
+        watermarks = [load_watermark(config.object_type, s.path(config.sync_state_path)) for s in shards]
+        unfinished = [str(s) for s in shards if Checkpoint(config.object_type, s.path(config.checkpoint_path)).resumable()]
+        if unfinished:
+            echo(f"⚠ Shards {', '.join(unfinished)} have not finished - run them again, then merge again")
+        elif all(w is not None for w in watermarks):
+            save_watermark(config.object_type, min(watermarks), config.sync_state_path)
+            summary["watermark"] = min(watermarks)
+            echo(f"✓ Delta sync watermark saved: {min(watermarks)}")
+    return summary
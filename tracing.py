@@ -0,0 +1,184 @@
+"""
+Leveled, structured logging and per-event trace spans for the webhook server.
+
+get_logger() returns a logger that takes fields as keyword arguments:
+
+    log.info("queued update", company_id=123, status="Listed")
+
+Records are handed to a bounded in-memory queue and written to stdout by a
+background thread, so a slow log pipe never holds up a request; if the queue
+is full the record is dropped and counted instead. LOG_FORMAT=json emits one
+JSON object per line, otherwise records are "message key=value ..." text.
+
+A Trace follows one webhook event from receipt to write-back. Each stage
+(parse, queue, fetch, tps, write) is timed with trace.span(stage), and
+trace.finish() logs the full stage breakdown at WARNING when the event took
+longer than TRACE_SLOW_MS, or at DEBUG otherwise. The time an event spends
+waiting in the queue is part of the breakdown but not of its latency, since
+most of it is the deliberate coalescing delay.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("LOG_PAYLOAD_MAX_CHARS", "500"))
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "2000"))
+
+_ROOT = "tps"
+_state = {"pid": None, "listener": None, "dropped": 0}
+_setup_lock = threading.Lock()
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records rather than blocking when the queue is full"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _state["dropped"] += 1
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if LOG_FORMAT == "json":
+            entry = {
+                "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{k}={_text(v)}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def _text(value):
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(",", ":"), default=str)
+    value = str(value)
+    return json.dumps(value) if not value or any(c in value for c in ' ="\n') else value
+
+
+class _FieldLogger(logging.LoggerAdapter):
+    """Moves keyword arguments into the record's structured fields"""
+
+    _RESERVED = ("exc_info", "stack_info", "stacklevel", "extra")
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in self._RESERVED}
+        kwargs["extra"] = {"fields": {**(self.extra or {}), **fields}}
+        return msg, kwargs
+
+    def bind(self, **fields):
+        """Return a logger that adds fields to every record"""
+        return _FieldLogger(self.logger, {**(self.extra or {}), **fields})
+
+
+def _setup():
+    if _state["pid"] == os.getpid():
+        return
+    with _setup_lock:
+        if _state["pid"] == os.getpid():
+            return
+        root = logging.getLogger(_ROOT)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(_Formatter())
+        records = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+        root.addHandler(_DroppingQueueHandler(records))
+        listener = logging.handlers.QueueListener(records, output)
+        listener.start()
+        _state.update(pid=os.getpid(), listener=listener)
+
+
+@atexit.register
+def shutdown():
+    """Write out any queued records (called at exit)"""
+    listener = _state["listener"]
+    if listener is not None and _state["pid"] == os.getpid():
+        listener.stop()
+        _state["listener"] = None
+        _state["pid"] = None
+
+
+def get_logger(name=None):
+    _setup()
+    return _FieldLogger(logging.getLogger(f"{_ROOT}.{name}" if name else _ROOT), {})
+
+
+def dropped():
+    """Number of log records dropped because the queue was full"""
+    return _state["dropped"]
+
+
+def sample_payload(log, raw, **fields):
+    """Log a truncated raw payload for a LOG_PAYLOAD_SAMPLE_RATE fraction of calls (all of them at DEBUG)"""
+    if log.isEnabledFor(logging.DEBUG) or random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        log.info("payload sample", payload=raw[:LOG_PAYLOAD_MAX_CHARS], size=len(raw), **fields)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """Stage timings for one event; spans are recorded in milliseconds"""
+
+    def __init__(self, trace_id=None, **fields):
+        self.trace_id = trace_id or new_trace_id()
+        self.fields = fields
+        self.stages = {}
+
+    def add(self, stage, ms):
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + ms, 1)
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - started) * 1000)
+
+    def latency_ms(self):
+        """Time spent handling the event, excluding the wait in the queue"""
+        return round(sum(ms for stage, ms in self.stages.items() if stage != "queue"), 1)
+
+    def finish(self, log, outcome, slow_ms=None):
+        """Log the event's outcome with its stage breakdown, at WARNING if it was slow"""
+        slow_ms = TRACE_SLOW_MS if slow_ms is None else slow_ms
+        latency = self.latency_ms()
+        level = logging.WARNING if latency >= slow_ms else logging.DEBUG
+        if log.isEnabledFor(level):
+            message = "slow event" if level == logging.WARNING else "event done"
+            log.log(
+                level, message, trace=self.trace_id, outcome=outcome, latency_ms=latency,
+                stages=self.stages, **self.fields,
+            )
+        return latency
@@ -0,0 +1,340 @@
+"""
+Bounded background worker pool used by the webhook service.
+
+Events are put on a bounded queue and drained by a fixed number of daemon
+threads. Items can also be submitted with a delay; they wait in a timer heap
+(counted against the same bound) until they are due. On shutdown the pool stops accepting work, gives the workers a grace
+period to drain the queue, and spills anything still pending to a JSON-lines
+file so it is picked up again by the next process.
+
+With a shared_queue (see shared_queue.py) the bound, the delays and the
+pending items live in the shared store instead: a dispatcher thread claims due
+items only while this process has idle workers, so load spreads across every
+gunicorn worker, and shutdown hands unstarted items back rather than spilling
+them.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import tracing
+
+_STOP = object()
+log = tracing.get_logger("worker_pool")
+
+
+class _Claim:
+    __slots__ = ("job_id", "item")
+
+    def __init__(self, job_id, item):
+        self.job_id = job_id
+        self.item = item
+
+
+class WorkerPool:
+    """Fixed-size pool of threads draining a bounded queue"""
+
+    def __init__(self, handler, workers=4, max_queue=1000, spill_path=None, name="worker",
+                 shared_queue=None, poll_interval=0.1):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.name = name
+        self.shared = shared_queue
+        self.poll_interval = max(0.01, float(poll_interval))
+        self._claimed = set()
+        self._wake = threading.Event()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._delayed = []
+        self._delayed_cond = threading.Condition()
+        self._seq = itertools.count()
+        self._accepting = False
+        self._pid = None
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    # --- lifecycle ---
+    def start(self):
+        """Start worker threads (idempotent, and safe to call after a fork)"""
+        with self._lock:
+            if self._accepting and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._delayed = []
+            self._claimed = set()
+            self._threads = []
+            self._accepting = True
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            if self.shared is not None:
+                threading.Thread(target=self._run_dispatcher, name=f"{self.name}-dispatch", daemon=True).start()
+            else:
+                threading.Thread(target=self._run_scheduler, name=f"{self.name}-timer", daemon=True).start()
+        self._reload_spilled()
+
+    def shutdown(self, timeout=20):
+        """Stop accepting work, drain the queue and spill leftovers to disk"""
+        with self._lock:
+            if not self._accepting:
+                return
+            self._accepting = False
+        if self.shared is not None:
+            self._shutdown_shared(timeout)
+            return
+
+        leftovers = []
+        # Delayed items don't wait out their delay once we're shutting down
+        with self._delayed_cond:
+            delayed = [item for _, _, item in sorted(self._delayed)]
+            self._delayed = []
+            self._delayed_cond.notify_all()
+        for item in delayed:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                leftovers.append(item)
+
+        deadline = time.monotonic() + max(0, timeout)
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            leftovers.append(item)
+
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                break
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+        if leftovers:
+            self._spill(leftovers)
+
+    def _shutdown_shared(self, timeout):
+        # The dispatcher stops claiming; workers finish what this process already claimed
+        self._wake.set()
+        deadline = time.monotonic() + max(0, timeout)
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        unstarted = []
+        while True:
+            try:
+                claim = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            unstarted.append(claim.job_id)
+        with self._lock:
+            self._claimed.difference_update(unstarted)
+            running = len(self._claimed)
+        try:
+            self.shared.release(unstarted)
+            if unstarted:
+                log.info("returned unstarted items to the shared queue", pool=self.name, items=len(unstarted))
+        except Exception as e:
+            log.error("could not release claimed items", pool=self.name, error=str(e)[:100],
+                      reclaimed_after_s=round(self.shared.claim_timeout))
+        if running:
+            log.warning("items still running at shutdown", pool=self.name, items=running,
+                        reclaimed_after_s=round(self.shared.claim_timeout))
+
+        for _ in self._threads:
+            self._queue.put_nowait(_STOP)
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    # --- producer side ---
+    def submit(self, item, delay=0):
+        """Enqueue an item (after delay seconds); returns False when full or shutting down"""
+        if not self._accepting:
+            self.rejected += 1
+            return False
+        if self.shared is not None:
+            if not self.shared.put(item, delay=delay, max_depth=self.max_queue):
+                self.rejected += 1
+                return False
+            if delay <= 0:
+                self._wake.set()
+            return True
+        if delay > 0:
+            with self._delayed_cond:
+                if self.free_slots() <= 0:
+                    self.rejected += 1
+                    return False
+                heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), item))
+                self._delayed_cond.notify()
+            return True
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.rejected += 1
+            return False
+
+    def free_slots(self):
+        return max(0, self.max_queue - self.depth())
+
+    def depth(self):
+        """Items waiting or running (in every process when the queue is shared)"""
+        if self.shared is not None:
+            return self.shared.depth()
+        return self._queue.qsize() + len(self._delayed)
+
+    def stats(self):
+        stats = {
+            "workers": self.workers,
+            "queue_depth": self.depth(),
+            "queue_capacity": self.max_queue,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+        if self.shared is not None:
+            stats["in_flight"] = len(self._claimed)
+            stats["shared_queue"] = self.shared.stats()
+        return stats
+
+    # --- consumer side ---
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            claim = item if isinstance(item, _Claim) else None
+            try:
+                self.handler(claim.item if claim else item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                log.exception("worker error", pool=self.name, error=str(e)[:150])
+            finally:
+                if claim:
+                    self._finish(claim)
+                self._queue.task_done()
+
+    def _finish(self, claim):
+        try:
+            self.shared.ack([claim.job_id])
+        except Exception as e:
+            log.error("could not ack queue item", pool=self.name, job_id=claim.job_id, error=str(e)[:100])
+        with self._lock:
+            self._claimed.discard(claim.job_id)
+        self._wake.set()
+
+    def _run_dispatcher(self):
+        """Claim due items from the shared queue whenever this process has idle workers"""
+        pid = os.getpid()
+        while pid == self._pid and self._accepting:
+            self._wake.clear()
+            with self._lock:
+                idle = self.workers - len(self._claimed)
+            claimed = []
+            if idle > 0:
+                try:
+                    claimed = self.shared.claim(idle)
+                except Exception as e:
+                    log.error("could not claim queue items", pool=self.name, error=str(e)[:100])
+            if claimed:
+                with self._lock:
+                    self._claimed.update(job_id for job_id, _ in claimed)
+                for job_id, item in claimed:
+                    self._queue.put(_Claim(job_id, item))
+            if idle > 0 and len(claimed) == idle:
+                continue
+            wait = self.poll_interval
+            if idle > len(claimed):
+                try:
+                    next_due = self.shared.next_due()
+                except Exception:
+                    next_due = None
+                if next_due is not None:
+                    wait = min(wait, next_due)
+            # Woken early by local submits and finished items
+            self._wake.wait(wait)
+
+    def _run_scheduler(self):
+        pid = os.getpid()
+        while pid == self._pid:
+            with self._delayed_cond:
+                if not self._accepting and not self._delayed:
+                    return
+                if not self._delayed:
+                    self._delayed_cond.wait(1.0)
+                    continue
+                due_at, _, item = self._delayed[0]
+                wait = due_at - time.monotonic()
+                if wait > 0:
+                    self._delayed_cond.wait(min(wait, 1.0))
+                    continue
+                heapq.heappop(self._delayed)
+            try:
+                self._queue.put(item, timeout=1.0)
+            except queue.Full:
+                # Workers are saturated - try again shortly
+                with self._delayed_cond:
+                    heapq.heappush(self._delayed, (time.monotonic() + 0.1, next(self._seq), item))
+
+    # --- spill file ---
+    def _spill(self, items):
+        if not self.spill_path:
+            log.warning("dropping pending items on shutdown (no spill file)", pool=self.name, items=len(items))
+            return
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for item in items:
+                    f.write(json.dumps(item) + "\n")
+            log.warning("spilled pending items", pool=self.name, items=len(items), path=self.spill_path)
+        except Exception as e:
+            log.error("could not spill pending items", pool=self.name, error=str(e)[:100])
+
+    def _reload_spilled(self):
+        if not self.spill_path or not self.spill_path.exists():
+            return
+        # Claim the file atomically so two processes don't both replay it
+        claimed = self.spill_path.with_name(f"{self.spill_path.name}.{os.getpid()}")
+        try:
+            os.replace(self.spill_path, claimed)
+        except OSError:
+            return
+        reloaded = 0
+        kept = []
+        with open(claimed, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if self.submit(item):
+                    reloaded += 1
+                else:
+                    kept.append(item)
+        claimed.unlink()
+        if kept:
+            self._spill(kept)
+        if reloaded:
+            log.info("reloaded spilled items", pool=self.name, items=reloaded, path=self.spill_path)